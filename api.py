@@ -0,0 +1,293 @@
+import hashlib
+
+from flask import Blueprint, Response, abort, jsonify, request
+from sqlalchemy.orm import Query
+
+from models import *
+from queries import artist_show_rows, split_artist_shows, split_venue_shows, venue_show_rows
+from replicas import read_from_replica
+from search import search_catalog
+
+# ----------------------------------------------------------------------------#
+# JSON API.
+#
+# Every response carries a strong ETag and Last-Modified computed from a cheap
+# version query (updated_at / counts) that runs before anything is loaded or
+# serialized, so an unchanged resource costs one small query and a 304.
+# Queries are built without a session so the ASGI app (asgi.py) can serve the
+# same endpoints from its async driver.
+# ----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+# Every endpoint here is a read
+api.before_request(read_from_replica)
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+
+def etag_for(full_path, version):
+    return hashlib.sha1(repr((full_path, version)).encode('utf-8')).hexdigest()
+
+
+def is_fresh(etag, last_modified, if_none_match, if_modified_since):
+    """Whether the client's copy, described by its conditional headers, is current."""
+    if if_none_match:
+        return if_none_match.contains(etag)
+    return bool(last_modified and if_modified_since
+                and if_modified_since.replace(tzinfo=None) >= last_modified)
+
+
+def conditional(version, last_modified, build, respond=jsonify):
+    """Return 304 if the client's copy matches `version`, otherwise respond(build())."""
+    etag = etag_for(request.full_path, version)
+    last_modified = last_modified.replace(microsecond=0) if last_modified else None
+    not_modified = is_fresh(etag, last_modified, request.if_none_match, request.if_modified_since)
+
+    response = Response(status=304) if not_modified else respond(build())
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def page_size(args):
+    return min(max(args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+
+
+def _run(query):
+    return query.with_session(db.session()).all()
+
+
+#  Queries
+#  ----------------------------------------------------------------
+
+GENRE_LINKS = { Venue: venue_genre.c.venue_id, Artist: artist_genre.c.artist_id }
+
+
+def table_version_query(model):
+    return Query([db.func.count(model.id), db.func.max(model.updated_at)])
+
+
+def listing_query(model, after_id, limit):
+    return Query([model.id, model.name, model.city, model.state, model.upcoming_shows_count]) \
+        .filter(model.id > after_id).order_by(model.id).limit(limit)
+
+
+def detail_version_query(model, owner_id, counterpart, foreign_key, counterpart_key):
+    # The row itself plus the newest counterpart shown in its show tiles
+    entity_modified = db.select([model.updated_at]).where(model.id == owner_id).as_scalar()
+    counterpart_modified = db.select([db.func.max(counterpart.updated_at)]) \
+        .select_from(db.join(Show, counterpart, counterpart_key == counterpart.id)) \
+        .where(foreign_key == owner_id).as_scalar()
+    return Query([entity_modified, counterpart_modified])
+
+
+def entity_query(model, owner_id, fields):
+    return Query([getattr(model, field) for field in fields]).filter(model.id == owner_id)
+
+
+def genre_names_query(model, owner_id):
+    link = GENRE_LINKS[model]
+    return Query([Genre.name]).join(link.table, link.table.c.genre_id == Genre.id) \
+        .filter(link == owner_id).order_by(Genre.name)
+
+
+def show_query():
+    return Query([
+        Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+        Show.artist_id, Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link')
+    ]).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+
+
+def shows_page_query(after_id, limit):
+    return show_query().filter(Show.id > after_id).order_by(Show.id).limit(limit)
+
+
+def shows_version_query():
+    return Query([
+        db.func.count(Show.id), db.func.max(Show.id),
+        db.select([db.func.max(Venue.updated_at)]).as_scalar(),
+        db.select([db.func.max(Artist.updated_at)]).as_scalar()
+    ])
+
+
+#  Versions and serialization
+#  ----------------------------------------------------------------
+
+def table_version(row):
+    count, last_modified = row
+    return (count, last_modified), last_modified
+
+
+def detail_version_of(row):
+    """(version, last_modified) from a detail_version_query() row, or None if the entity is missing."""
+    entity_modified, counterpart_modified = row
+    if entity_modified is None:
+        return None
+    return (entity_modified, counterpart_modified), max(filter(None, (entity_modified, counterpart_modified)))
+
+
+def shows_version(row):
+    count, last_id, venues_modified, artists_modified = row
+    modified = [value for value in (venues_modified, artists_modified) if value]
+    return (count, last_id, venues_modified, artists_modified), max(modified) if modified else None
+
+
+def serialize_page(rows, limit, serialize=lambda row: row._asdict()):
+    return {
+        "data": [serialize(row) for row in rows],
+        "next_after_id": rows[-1].id if len(rows) == limit else None
+    }
+
+
+def serialize_shows(split):
+    (past_shows, past_count), (upcoming_shows, upcoming_count) = split
+    for show in past_shows + upcoming_shows:
+        show["start_time"] = show["start_time"].isoformat()
+        # Only there to version the page's show tiles
+        show.pop("artist_updated_at", None)
+        show.pop("venue_updated_at", None)
+    return {
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": past_count,
+        "upcoming_shows_count": upcoming_count
+    }
+
+
+def serialize_entity(row, genre_rows):
+    data = row._asdict()
+    data["genres"] = [genre.name for genre in genre_rows]
+    return data
+
+
+def serialize_show(row):
+    data = row._asdict()
+    data["start_time"] = row.start_time.isoformat()
+    return data
+
+
+VENUE_FIELDS = ('id', 'name', 'address', 'city', 'state', 'phone', 'website', 'facebook_link',
+                'seeking_talent', 'seeking_description', 'image_link')
+ARTIST_FIELDS = ('id', 'name', 'city', 'state', 'phone', 'website', 'facebook_link',
+                 'seeking_venue', 'seeking_description', 'image_link')
+# (fields, counterpart, foreign key, counterpart key, show rows, split) per detail endpoint
+DETAILS = {
+    Venue: (VENUE_FIELDS, Artist, Show.venue_id, Show.artist_id, venue_show_rows, split_venue_shows),
+    Artist: (ARTIST_FIELDS, Venue, Show.artist_id, Show.venue_id, artist_show_rows, split_artist_shows),
+}
+
+
+#  Endpoints
+#  ----------------------------------------------------------------
+
+def detail_version(model, owner_id, counterpart, foreign_key, counterpart_key):
+    version = detail_version_of(_run(detail_version_query(model, owner_id, counterpart, foreign_key,
+                                                          counterpart_key))[0])
+    if version is None:
+        abort(404)
+    return version
+
+
+def _listing(model):
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = page_size(request.args)
+    version, last_modified = table_version(_run(table_version_query(model))[0])
+
+    def build():
+        return serialize_page(_run(listing_query(model, after_id, limit)), limit)
+
+    return conditional(version, last_modified, build)
+
+
+def _search(model):
+    search_term = request.args.get('q', '')
+    page = request.args.get('page', 1, type=int)
+    limit = page_size(request.args)
+    version, last_modified = table_version(_run(table_version_query(model))[0])
+
+    def build():
+        rows, count = search_catalog(model, search_term, page=page, per_page=limit)
+        return { "count": count, "data": [row._asdict() for row in rows] }
+
+    return conditional(version, last_modified, build)
+
+
+def _detail(model, owner_id):
+    fields, counterpart, foreign_key, counterpart_key, show_rows, split = DETAILS[model]
+    version, last_modified = detail_version(model, owner_id, counterpart, foreign_key, counterpart_key)
+
+    def build():
+        data = serialize_entity(_run(entity_query(model, owner_id, fields))[0],
+                                _run(genre_names_query(model, owner_id)))
+        data.update(serialize_shows(split(_run(show_rows(owner_id)))))
+        return data
+
+    return conditional(version, last_modified, build)
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+def list_venues():
+    return _listing(Venue)
+
+
+@api.route('/venues/search')
+def search_venues():
+    return _search(Venue)
+
+
+@api.route('/venues/<int:venue_id>')
+def get_venue(venue_id):
+    return _detail(Venue, venue_id)
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+def list_artists():
+    return _listing(Artist)
+
+
+@api.route('/artists/search')
+def search_artists():
+    return _search(Artist)
+
+
+@api.route('/artists/<int:artist_id>')
+def get_artist(artist_id):
+    return _detail(Artist, artist_id)
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+def list_shows():
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = page_size(request.args)
+    version, last_modified = shows_version(_run(shows_version_query())[0])
+
+    def build():
+        return serialize_page(_run(shows_page_query(after_id, limit)), limit, serialize_show)
+
+    return conditional(version, last_modified, build)
+
+
+@api.route('/shows/<int:show_id>')
+def get_show(show_id):
+    # A single joined row is its own version
+    rows = _run(show_query().filter(Show.id == show_id))
+    if not rows:
+        abort(404)
+    return conditional(tuple(rows[0]), None, lambda: serialize_show(rows[0]))
+
+
+@api.errorhandler(404)
+def not_found(error):
+    return jsonify({ "error": "Not found" }), 404
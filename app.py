@@ -4,161 +4,137 @@
 
 import logging
 import os
-from audioop import add
-from datetime import datetime
-from distutils.command.clean import clean
+from datetime import datetime, timedelta
+from itertools import groupby
 from logging import FileHandler, Formatter
 
-import babel
+import click
 import dateutil.parser
-from flask import (Flask, Response, flash, redirect, render_template, request,
-                   url_for)
+from flask import (Blueprint, Flask, Response, abort, current_app, flash, jsonify, redirect,
+                   render_template, request, stream_with_context, url_for)
 from flask_migrate import Migrate
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-from flask_wtf import Form
-from sqlalchemy.orm import defer, undefer
 
 from forms import *
+from api import (DETAILS, api, conditional, detail_version, entity_query, genre_names_query,
+                 serialize_entity)
+from assets import init_assets
+from cache import cached_page, page_cache, tag_page
+from calendars import calendar_query, ics_stream
+from counters import *
+from exporter import EXPORT_FORMATS, EXPORT_KINDS, export_stream
+from formatting import format_datetime, format_datetimes
+from fragments import fragment_cache
+from genres import *
+from images import image_store
+from importer import IMPORT_KINDS, import_file
+from instrumentation import init_sql_instrumentation
+from metrics import init_metrics, record_created
 from models import *
+from queries import *
+from replicas import replica_reads, replica_set
+from search import *
+from seeder import REFERENCE_TIME, seed_catalog
+from typeahead import *
+from workers import install_fork_guards
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-
-migrate = Migrate(app, db)
-
-#----------------------------------------------------------------------------#
-# Filters.
-#----------------------------------------------------------------------------#
-
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
-
-app.jinja_env.filters['datetime'] = format_datetime
-current_time = datetime.now()
+# Extensions are bound to each app in create_app(); db is the one in models.py
+moment = Moment()
+migrate = Migrate()
+# Pages, forms and CLI commands; the JSON API is the `api` blueprint
+main = Blueprint('main', __name__, cli_group=None)
+
+SHOWS_PER_PAGE = 30
+VENUES_PER_AREA = 10
+DIRECTORY_PAGE_SIZE = 50
+DIRECTORY_MAX_PAGE_SIZE = 100
+DIRECTORY_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+VENUE_FILTERS = ('state', 'city', 'genre')
+ARTIST_FILTERS = ('state', 'genre')
+SEARCH_RESULTS_PER_PAGE = 20
+CALENDAR_PAGE_SIZE = 200
+CALENDAR_MAX_PAGE_SIZE = 1000
+CALENDAR_DEFAULT_DAYS = 30
+CALENDAR_MAX_DAYS = 92
+CALENDAR_FEED_PAST_DAYS = 30
+TYPEAHEAD_MAX_RESULTS = 25
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@main.route('/')
+@cached_page
 def index():
+  tag_page('home')
   return render_template('pages/home.html')
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
-def venues():
-  data = []
-
-  venues = Venue.query.all()
-  city_state = set()
-  for venue in venues:
-    city_state.add((venue.city, venue.state))
-
-  city_state = list(city_state)
-  city_state.sort(key=lambda tup: tup[1]) # Sort by state code
-
-  # Get venue per region
-  for pairing in city_state:
-    venue_list = []
-
-    for venue in venues:
-      venue_city, venue_state = pairing
-      if (venue.city == venue_city) and (venue.state == venue_state):
-        num_upcoming_shows = 0 
-
-        for show in venue.shows:
-          if show.start_time > current_time: num_upcoming_shows += 1
-
-        venue_list.append({ "id": venue.id, "name": venue.name,"num_upcoming_shows": num_upcoming_shows })
-
-    data.append({
-      "city": venue_city,
-      "state": venue_state,
-      "venues": venue_list
-    })
-
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
-  search_term = request.form.get('search_term', '').strip()
-
-  data = []
-  venue_search_query = filter_term(search_field=Venue.name, search_term=search_term)
-  matching_venues = Venue.query.filter(venue_search_query).all()
-
-  for venue in matching_venues:
-    num_upcoming_shows = 0
-
-    for show in venue.shows:
-      if show.start_time > current_time: num_upcoming_shows += 1
-
-    data.append({"id": venue.id, "name": venue.name, "num_upcoming_shows": num_upcoming_shows})
-
-  response = {
-    "count": len(matching_venues),
-    "data": data
-  }
-
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-  venue = Venue.query.get(venue_id)
-
-  if not venue:
-    return redirect(url_for('index'))
-
-  past_shows, past_shows_count = venue_past_shows(venue.shows)
-  upcoming_shows, upcoming_shows_count = venue_upcoming_shows(venue.shows)
-
-  genres = [ genre.name for genre in venue.genres ]
-
-  data = {
-    "id": venue.id,
-    "name": venue.name,
-    "genres": genres,
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link,
+def venue_index_queries():
+  # Unfiltered, the index groups venues by area; a filter, letter or cursor lists them by name
+  if any(request.args.get(key, '').strip() for key in VENUE_FILTERS) \
+      or request.args.get('letter') or request.args.get('after'):
+    return directory_queries(Venue, VENUE_FILTERS)
+  return { "areas": venue_area_rows(limit_per_area=VENUES_PER_AREA) }
+
+@main.route('/venues')
+@cached_page
+@replica_reads
+@read_page(venue_index_queries)
+def venues(results):
+  tag_page('venues')
+  if 'areas' not in results:
+    return render_template('pages/venues.html', **directory(results['directory'], 'main.venues', VENUE_FILTERS))
+
+  areas = []
+  for (state, city), area_rows in groupby(results['areas'], key=lambda row: (row.state, row.city)):
+    area_rows = list(area_rows)
+    areas.append({ "city": city, "state": state, "venues": area_rows, "total_venues": area_rows[0].area_size })
+  return render_template('pages/venues.html', areas=areas, **directory_form({}))
+
+@main.route('/venues/search', methods=['GET', 'POST'])
+@replica_reads
+@read_page(lambda: search_page_queries(Venue))
+def search_venues(results):
+  return render_search_results('pages/search_venues.html', results)
+
+@main.route('/venues/<int:venue_id>')
+@cached_page
+@replica_reads
+@read_page(lambda venue_id: owner_page_queries(Venue, venue_id))
+def show_venue(results, venue_id):
+  if not results['owner']:
+    return redirect(url_for('main.index'))
+
+  (past_shows, past_shows_count), (upcoming_shows, upcoming_shows_count) = split_venue_shows(results['shows'])
+  tag_page(f'venue:{venue_id}', *{ f"artist:{show['artist_id']}" for show in past_shows + upcoming_shows })
+
+  data = serialize_entity(results['owner'][0], results['genres'])
+  data.update({
     "past_shows": past_shows,
     "upcoming_shows": upcoming_shows,
     "past_shows_count": past_shows_count,
     "upcoming_shows_count": upcoming_shows_count
-  }
+  })
 
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission(): 
   form = VenueForm()
 
@@ -175,23 +151,17 @@ def create_venue_submission():
   facebook_link = form.facebook_link.data
 
   try:
+    image_link = image_store.save_upload(form.image_file.data) or image_link
     venue = Venue(name=name, city=city, state=state, address=address, phone=phone, 
     seeking_talent=seeking_talent, seeking_description=seeking_description, 
     image_link=image_link, website=website, facebook_link=facebook_link)
     
-    existing_genres= { genre.name: genre for genre in Genre.query.all() }
-
-    # Get genre if exist or create a new genre entry
-    for genre in genres:
-        if genre in existing_genres:
-            venue.genres.append(existing_genres[genre])
-        else:
-            new_genre = Genre(name=genre)
-            db.session.add(new_genre)
-            venue.genres.append(new_genre)
+    venue.genres = get_or_create_genres(genres)
 
     db.session.add(venue)
     db.session.commit()
+    page_cache.invalidate('venues')
+    record_created('venue')
     flash(f"Venue '{request.form['name']}' was successfully listed!")
   except Exception as e:
     print(e)
@@ -201,93 +171,71 @@ def create_venue_submission():
     db.session.close()
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@main.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   print(venue_id)
   venue = Venue.query.get(venue_id)
 
   if not venue:
     flash(f'An error occurred. Could not find venue with ID: {venue_id}.')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
   try:
+    tags = ('venues', 'shows', f'venue:{venue.id}')
     db.session.delete(venue)
     db.session.commit()
+    page_cache.invalidate(*tags)
   except:
     flash(f'An error occurred deleting venue: {venue.name}.')
     db.session.rollback()
   finally:
     db.session.close()
-  return redirect(url_for('venues'))
+  return redirect(url_for('main.venues'))
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
-def artists():
-
-  data = db.session.query(Artist).options(defer("*"), undefer("id"), undefer("name")).all()
-
-  return render_template('pages/artists.html', artists=data)
-
-@app.route('/artists/search', methods=['POST'])
-def search_artists():
-  search_term = request.form.get('search_term', '').strip()
-
-  data = []
-  artist_search_query = filter_term(search_field=Artist.name, search_term=search_term)
-  matching_artists = Artist.query.filter(artist_search_query).all()
-
-  for artist in matching_artists:
-    num_upcoming_shows = 0
-
-    for show in artist.shows:
-      if show.start_time > current_time: num_upcoming_shows += 1
-
-    data.append({"id": artist.id, "name": artist.name, "num_upcoming_shows": num_upcoming_shows})
-
-  response={
-    "count": len(matching_artists),
-    "data": data
-  }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-  artist = Artist.query.filter_by(id=artist_id).first()
-  shows = Show.query.filter_by(artist_id=artist_id).all()
-
-  past_shows, past_shows_count = artist_past_shows(shows)
-  upcoming_shows, upcoming_shows_count = artist_upcoming_shows(shows)
-
-  genres = [ genre.name for genre in artist.genres ]
-
-  data = {
-    "id": artist.id,
-    "name": artist.name,
-    "genres": genres,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link,
+@main.route('/artists')
+@cached_page
+@replica_reads
+@read_page(lambda: directory_queries(Artist, ARTIST_FILTERS))
+def artists(results):
+  tag_page('artists')
+  return render_template('pages/artists.html', **directory(results['directory'], 'main.artists', ARTIST_FILTERS))
+
+@main.route('/artists/search', methods=['GET', 'POST'])
+@replica_reads
+@read_page(lambda: search_page_queries(Artist))
+def search_artists(results):
+  return render_search_results('pages/search_artists.html', results)
+
+@main.route('/artists/<int:artist_id>')
+@cached_page
+@replica_reads
+@read_page(lambda artist_id: owner_page_queries(Artist, artist_id))
+def show_artist(results, artist_id):
+  if not results['owner']:
+    return redirect(url_for('main.index'))
+
+  (past_shows, past_shows_count), (upcoming_shows, upcoming_shows_count) = split_artist_shows(results['shows'])
+  tag_page(f'artist:{artist_id}', *{ f"venue:{show['venue_id']}" for show in past_shows + upcoming_shows })
+
+  data = serialize_entity(results['owner'][0], results['genres'])
+  data.update({
     "past_shows": past_shows,
     "upcoming_shows": upcoming_shows,
     "past_shows_count": past_shows_count,
     "upcoming_shows_count": upcoming_shows_count,
-  }
+  })
 
   return render_template('pages/show_artist.html', artist=data)
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   artist = Artist.query.get(artist_id)
   if not artist:
-      return redirect(url_for('index'))
+      return redirect(url_for('main.index'))
 
   form = ArtistForm(obj=artist)
   genres = [ genre.name for genre in artist.genres ]
@@ -307,7 +255,7 @@ def edit_artist(artist_id):
   }
   return render_template('forms/edit_artist.html', form=form, artist=artist_data)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   form = ArtistForm()
 
@@ -328,23 +276,15 @@ def edit_artist_submission(artist_id):
     artist.city = city
     artist.state = state
     artist.phone = phone
-    artist.genres = []
+    artist.genres = get_or_create_genres(genres)
     artist.facebook_link = facebook_link
     artist.website = website
-    artist.image_link = image_link
+    artist.image_link = image_store.save_upload(form.image_file.data) or image_link
     artist.seeking_venue = seeking_venue
     artist.seeking_description = seeking_description
 
-    for genre in genres:
-      existing_genre = Genre.query.filter_by(name=genre).one_or_none()
-
-      if existing_genre:
-          artist.genres.append(existing_genre)
-      else:
-          new_genre = Genre(name=genre)
-          db.session.add(new_genre)
-          artist.genres.append(new_genre)
     db.session.commit()
+    page_cache.invalidate('artists', 'shows', f'artist:{artist_id}')
     flash(f"Artist '{request.form['name']}' was successfully updated!")
   except:
     db.session.rollback()
@@ -352,14 +292,14 @@ def edit_artist_submission(artist_id):
   finally:
     db.session.close()
 
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  return redirect(url_for('main.show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   venue = Venue.query.get(venue_id)
 
   if not venue:
-      return redirect(url_for('index'))
+      return redirect(url_for('main.index'))
 
   form = VenueForm(obj=venue)
   genres = [ genre.name for genre in venue.genres ]
@@ -380,7 +320,7 @@ def edit_venue(venue_id):
   }
   return render_template('forms/edit_venue.html', form=form, venue=venue_data)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   form = VenueForm()
 
@@ -404,24 +344,16 @@ def edit_venue_submission(venue_id):
     venue.state = state
     venue.address = address
     venue.phone = phone
-    venue.genres = []
+    venue.genres = get_or_create_genres(genres)
     venue.facebook_link = facebook_link
     venue.website = website
-    venue.image_link = image_link
+    venue.image_link = image_store.save_upload(form.image_file.data) or image_link
     venue.seeking_talent = seeking_talent
     venue.seeking_description = seeking_description
 
-    for genre in genres:
-      existing_genre = Genre.query.filter_by(name=genre).one_or_none()
-
-      if existing_genre:
-          venue.genres.append(existing_genre)
-      else:
-          new_genre = Genre(name=genre)
-          db.session.add(new_genre)
-          venue.genres.append(new_genre)
 
     db.session.commit()
+    page_cache.invalidate('venues', 'shows', f'venue:{venue_id}')
     flash(f"Venue '{request.form['name']}' was successfully updated!")
   except:
     db.session.rollback()
@@ -429,17 +361,17 @@ def edit_venue_submission(venue_id):
   finally:
     db.session.close()
 
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   form = ArtistForm()
 
@@ -455,25 +387,19 @@ def create_artist_submission():
   facebook_link = form.facebook_link.data.strip()
 
   try:
+    image_link = image_store.save_upload(form.image_file.data) or image_link
     artist = Artist(name=name, city=city, state=state, phone=phone,
                     facebook_link=facebook_link,
                     website=website, image_link=image_link,
                     seeking_venue=seeking_venue,
                     seeking_description=seeking_description)
 
-    existing_genres= { genre.name: genre for genre in Genre.query.all() }
-
-    # Get genre if exist or create a new genre entry
-    for genre in genres:
-      if genre in existing_genres:
-          artist.genres.append(existing_genres[genre])
-      else:
-          new_genre = Genre(name=genre)
-          db.session.add(new_genre)
-          artist.genres.append(new_genre)
+    artist.genres = get_or_create_genres(genres)
 
     db.session.add(artist)
     db.session.commit()
+    page_cache.invalidate('artists')
+    record_created('artist')
     flash(f"Artist '{request.form['name']}' was successfully listed!")
   except Exception as e:
     flash(f"An error occurred. Artist '{request.form['name']}' could not be listed.")
@@ -488,40 +414,62 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
-def shows():
-  data = []
-  shows = Show.query.all()
+def show_page_queries():
+  cursor = parse_show_cursor(request.args.get('after'))
+  return { "shows": show_tile_rows(parse_date_arg('from'), parse_date_arg('to'), after=cursor, limit=SHOWS_PER_PAGE) }
 
-  for show in shows:
+@main.route('/shows')
+@cached_page
+@replica_reads
+@read_page(show_page_queries)
+def shows(results):
+  has_next = len(results['shows']) > SHOWS_PER_PAGE
+  rows = results['shows'][:SHOWS_PER_PAGE]
+  tag_page('shows')
+
+  data = []
+  start_times = format_datetimes((row.start_time for row in rows), 'full')
+  for row, start_time in zip(rows, start_times):
     data.append({
-      "venue_id": show.venue_id,
-      "venue_name": Venue.query.filter_by(id=show.venue_id).first().name,
-      "artist_id": show.artist_id,
-      "artist_name": Artist.query.filter_by(id=show.artist_id).first().name,
-      "artist_image_link": Artist.query.filter_by(id=show.artist_id).first().image_link,
-      "start_time": format_datetime(str(show.start_time))
+      "id": row.id,
+      "venue_id": row.venue_id,
+      "venue_name": row.venue_name,
+      "venue_updated_at": row.venue_updated_at,
+      "artist_id": row.artist_id,
+      "artist_name": row.artist_name,
+      "artist_image_link": row.artist_image_link,
+      "artist_updated_at": row.artist_updated_at,
+      "start_time": start_time
     })
-  return render_template('pages/shows.html', shows=data)
 
-@app.route('/shows/create')
+  next_url = None
+  if has_next:
+    last = rows[-1]
+    next_url = url_for('main.shows', after=encode_show_cursor(last.start_time, last.id),
+                       **{'from': request.args.get('from'), 'to': request.args.get('to')})
+
+  return render_template('pages/shows.html', shows=data, next_url=next_url)
+
+@main.route('/shows/create')
 def create_shows():
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
   try:
     cleaned_data = form_data_cleanser(request.form)
 
     artist_id = cleaned_data['artist_id']
     venue_id = cleaned_data['venue_id']
-    start_time = cleaned_data['start_time']
+    start_time = dateutil.parser.parse(cleaned_data['start_time'])
 
     show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
 
     db.session.add(show)
     db.session.commit()
+    page_cache.invalidate('shows', 'venues', 'artists', f'venue:{venue_id}', f'artist:{artist_id}')
+    record_created('show')
 
     flash('Show was successfully listed!')
   except:
@@ -532,78 +480,345 @@ def create_show_submission():
 
   return render_template('pages/home.html')
 
-@app.errorhandler(404)
+#  Calendar
+#  ----------------------------------------------------------------
+
+@main.route('/shows/calendar')
+@cached_page
+@replica_reads
+def shows_calendar():
+  date_from = parse_date_arg('from') or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+  date_to = parse_date_arg('to') or date_from + timedelta(days=CALENDAR_DEFAULT_DAYS)
+  if not timedelta(0) < date_to - date_from <= timedelta(days=CALENDAR_MAX_DAYS):
+    return jsonify({"error": f"'to' must be after 'from' and at most {CALENDAR_MAX_DAYS} days later"}), 400
+
+  limit = min(max(request.args.get('limit', CALENDAR_PAGE_SIZE, type=int), 1), CALENDAR_MAX_PAGE_SIZE)
+  filters = {
+    "venue_id": request.args.get('venue_id', type=int),
+    "artist_id": request.args.get('artist_id', type=int),
+    "state": request.args.get('state', '').strip() or None
+  }
+  query = calendar_query(date_from, date_to, **filters)
+  cursor = parse_show_cursor(request.args.get('after'))
+  if cursor:
+    query = query.filter(db.tuple_(Show.start_time, Show.id) > db.tuple_(*cursor))
+
+  # Fetch one extra row to know whether a next page exists
+  rows = query.limit(limit + 1).all()
+  has_next = len(rows) > limit
+  rows = rows[:limit]
+  tag_page('shows')
+
+  data = []
+  for row in rows:
+    show = row._asdict()
+    show["start_time"] = row.start_time.isoformat()
+    data.append(show)
+
+  next_url = None
+  if has_next:
+    last = rows[-1]
+    next_url = url_for('main.shows_calendar', after=encode_show_cursor(last.start_time, last.id),
+                       limit=request.args.get('limit'), **{'from': date_from.isoformat(), 'to': date_to.isoformat()},
+                       **filters)
+
+  return jsonify({"from": date_from.isoformat(), "to": date_to.isoformat(), "data": data, "next": next_url})
+
+def calendar_feed(model, owner_id, counterpart, foreign_key, counterpart_key):
+  # Recent and upcoming shows; the window moves once a day so the feed is stable in between
+  since = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=CALENDAR_FEED_PAST_DAYS)
+  version, last_modified = detail_version(model, owner_id, counterpart, foreign_key, counterpart_key)
+
+  def build():
+    name = db.session.query(model.name).filter(model.id == owner_id).scalar()
+    query = calendar_query(since).filter(foreign_key == owner_id)
+    return ics_stream(query, f'{name} on Fyyur', last_modified, request.host)
+
+  # An unchanged feed costs the version query and a 304
+  return conditional((version, since), last_modified, build,
+                     respond=lambda stream: Response(stream_with_context(stream), mimetype='text/calendar'))
+
+@main.route('/venues/<int:venue_id>/calendar.ics')
+@replica_reads
+def venue_calendar(venue_id):
+  return calendar_feed(Venue, venue_id, Artist, Show.venue_id, Show.artist_id)
+
+@main.route('/artists/<int:artist_id>/calendar.ics')
+@replica_reads
+def artist_calendar(artist_id):
+  return calendar_feed(Artist, artist_id, Venue, Show.artist_id, Show.venue_id)
+
+#  Export
+#  ----------------------------------------------------------------
+
+EXPORT_MIMETYPES = { 'csv': 'text/csv', 'ndjson': 'application/x-ndjson' }
+
+@main.route('/export/<kind>.<fmt>')
+@replica_reads
+def export(kind, fmt):
+  if kind not in EXPORT_KINDS or fmt not in EXPORT_FORMATS:
+    abort(404)
+
+  compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+  filename = f'{kind}.{fmt}' + ('.gz' if compress else '')
+  stream = export_stream(kind, fmt, compress=compress,
+                         date_from=parse_date_arg('from'), date_to=parse_date_arg('to'),
+                         state=request.args.get('state') or None, genre=request.args.get('genre') or None)
+
+  return Response(stream_with_context(stream),
+                  mimetype='application/gzip' if compress else EXPORT_MIMETYPES[fmt],
+                  headers={ 'Content-Disposition': f'attachment; filename={filename}' })
+
+@main.cli.command('export')
+@click.argument('kind', type=click.Choice(EXPORT_KINDS))
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='Output file (default: stdout).')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--from', 'date_from', type=click.DateTime(), default=None, help='Shows starting on or after.')
+@click.option('--to', 'date_to', type=click.DateTime(), default=None, help='Shows starting before.')
+@click.option('--state', default=None)
+@click.option('--genre', default=None)
+def export_command(kind, fmt, output, compress, date_from, date_to, state, genre):
+  """Stream venues, artists or shows as CSV or NDJSON."""
+  for chunk in export_stream(kind, fmt, compress=compress, date_from=date_from, date_to=date_to,
+                             state=state, genre=genre):
+    output.write(chunk)
+
+#  Typeahead
+#  ----------------------------------------------------------------
+
+@main.before_app_first_request
+def load_typeahead_indexes():
+  # Already built if the app was warmed up before the workers were forked
+  if typeahead_indexes_loaded():
+    return
+  try:
+    build_typeahead_indexes()
+  except Exception as e:
+    current_app.logger.error(f'Could not build typeahead indexes: {e}')
+
+@main.route('/api/typeahead')
+@replica_reads
+def typeahead_search():
+  kind = request.args.get('kind', 'artist')
+  if kind not in TYPEAHEAD_MODELS:
+    return jsonify({"error": f"Unknown kind '{kind}'"}), 400
+
+  limit = min(max(request.args.get('limit', 10, type=int), 1), TYPEAHEAD_MAX_RESULTS)
+  results = typeahead(kind, request.args.get('q', ''), limit=limit,
+                      refresh_interval=current_app.config.get('TYPEAHEAD_REFRESH_INTERVAL'))
+  return jsonify({"results": results})
+
+#  Page cache
+#  ----------------------------------------------------------------
+
+@main.route('/cache/stats')
+def cache_stats():
+  return jsonify(dict(page_cache.stats(), fragments=fragment_cache.stats(), images=image_store.stats()))
+
+def invalidate_show_owners(owners):
+  # Upcoming counts appear on the directories and the detail pages
+  page_cache.invalidate('venues', 'artists',
+                        *[f'venue:{venue_id}' for venue_id in owners[Venue]],
+                        *[f'artist:{artist_id}' for artist_id in owners[Artist]])
+
+#  Show counters
+#  ----------------------------------------------------------------
+
+last_counter_rollover = datetime.min
+
+@main.before_app_request
+def roll_over_show_counters():
+  # Cheap in-process fallback for the `flask rollover-counters` cron job
+  global last_counter_rollover
+  interval = current_app.config.get('COUNTER_ROLLOVER_INTERVAL', 0)
+  if not interval or (datetime.now() - last_counter_rollover).total_seconds() < interval:
+    return
+
+  last_counter_rollover = datetime.now()
+  try:
+    rollover_show_counters(on_moved=invalidate_show_owners)
+  except Exception as e:
+    current_app.logger.error(f'Show counter rollover failed: {e}')
+
+@main.cli.command('rollover-counters')
+def rollover_counters_command():
+  """Move shows that have started into the past show counters."""
+  moved = rollover_show_counters(on_moved=invalidate_show_owners)
+  print(f'Rolled over {moved} shows.')
+
+@main.cli.command('rebuild-counters')
+def rebuild_counters_command():
+  """Recompute every venue and artist show counter from the Show table."""
+  rebuild_show_counters()
+  page_cache.backend.clear()
+  print('Show counters rebuilt.')
+
+#  Bulk import
+#  ----------------------------------------------------------------
+
+@main.cli.command('import')
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Input format (default: from the file extension).')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per insert statement.')
+@click.option('--commit-every', default=10, show_default=True, help='Batches per transaction.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+              help='Resume file (default: PATH.checkpoint).')
+@click.option('--rejects', type=click.Path(dir_okay=False), default=None,
+              help='Rejected rows file (default: PATH.rejects.ndjson).')
+@click.option('--id-map', type=click.Path(dir_okay=False), default=None,
+              help='Exported -> new venue and artist ids; written by venue and artist imports, read by show imports.')
+@click.option('--copy/--no-copy', 'use_copy', default=True, show_default=True,
+              help='Use COPY on PostgreSQL.')
+def import_command(kind, path, fmt, batch_size, commit_every, checkpoint, rejects, id_map, use_copy):
+  """Stream a CSV or NDJSON file of genres, venues, artists or shows into the database."""
+  imported, rejected, seconds = import_file(
+    kind, path, fmt=fmt, batch_size=batch_size, commit_every=commit_every,
+    checkpoint_path=checkpoint or f'{path}.checkpoint', rejects_path=rejects or f'{path}.rejects.ndjson',
+    id_map_path=id_map, use_copy=use_copy, report=click.echo)
+  click.echo(f'Imported {imported} {kind} and rejected {rejected} in {seconds:.1f}s '
+             f'({(imported + rejected) / max(seconds, 1e-9):.0f} rows/sec).')
+
+#  Synthetic data
+#  ----------------------------------------------------------------
+
+@main.cli.command('seed')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=2000, show_default=True)
+@click.option('--shows', default=50000, show_default=True)
+@click.option('--seed', default=0, show_default=True, help='Random seed; the same seed gives the same data.')
+@click.option('--upcoming', 'upcoming_share', default=0.3, show_default=True,
+              help='Share of shows in the year after --reference; the rest are in the three years before.')
+@click.option('--skew', default=1.0, show_default=True,
+              help='Zipf exponent of shows per venue and artist (0 spreads them evenly).')
+@click.option('--reference', type=click.DateTime(), default=str(REFERENCE_TIME), show_default=True,
+              help='Time the shows are placed around; pass the current time for shows still to come.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per insert statement.')
+@click.option('--copy/--no-copy', 'use_copy', default=True, show_default=True,
+              help='Use COPY on PostgreSQL.')
+def seed_command(venues, artists, shows, seed, upcoming_share, skew, reference, batch_size, use_copy):
+  """Insert a reproducible synthetic catalog, e.g. --venues 100000 --artists 200000 --shows 5000000."""
+  if shows and not (venues and artists):
+    raise click.UsageError('Shows need at least one venue and one artist.')
+  seconds = seed_catalog(venues=venues, artists=artists, shows=shows, seed=seed, upcoming_share=upcoming_share,
+                         skew=skew, batch_size=batch_size, use_copy=use_copy, reference=reference,
+                         report=click.echo)
+  click.echo(f'Seeded {venues} venues, {artists} artists and {shows} shows in {seconds:.1f}s.')
+
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 #  Custom Helpers
 #  ----------------------------------------------------------------
-def venue_past_shows(shows):
-  past_shows = []
-  for show in shows:
-    if show.start_time <= current_time:
-      past_shows.append({
-        "artist_id": show.artist_id,
-        "artist_name": Artist.query.get(show.artist_id).name,
-        "artist_image_link": Artist.query.get(show.artist_id).image_link,
-        "start_time": format_datetime(str(show.start_time))
-      })
-  return past_shows, len(past_shows)
-
-
-def venue_upcoming_shows(shows):
-  upcoming_shows = []
-  for show in shows:
-    if show.start_time > current_time:
-      upcoming_shows.append({
-        "artist_id": show.artist_id,
-        "artist_name": Artist.query.get(show.artist_id).name,
-        "artist_image_link": Artist.query.get(show.artist_id).image_link,
-        "start_time": format_datetime(str(show.start_time))
-      })
-  return upcoming_shows, len(upcoming_shows)
-
-def artist_past_shows(shows):
-  past_shows = []
-  for show in shows:
-    if show.start_time <= current_time:
-      past_shows.append({
-        'venue_id' : show.venue_id,
-        'venue_name' : Venue.query.get(show.venue_id).name,
-        'venue_image_link': Venue.query.get(show.venue_id).image_link,
-        'start_time': format_datetime(str(show.start_time))
-      })
-  return past_shows, len(past_shows)
-
-def artist_upcoming_shows(shows):
-  upcoming_shows = []
-  for show in shows:
-    if show.start_time > current_time:
-      upcoming_shows.append({
-        'venue_id' : show.venue_id,
-        'venue_name' : Venue.query.get(show.venue_id).name,
-        'venue_image_link': Venue.query.get(show.venue_id).image_link,
-        'start_time': format_datetime(str(show.start_time))
-      })
-  return upcoming_shows, len(upcoming_shows)
-
-def filter_term(search_field, search_term):
-  return search_field.ilike(f'%{search_term}%')
+def parse_date_arg(name):
+  value = request.args.get(name, '').strip()
+  if not value:
+    return None
+  try:
+    value = dateutil.parser.parse(value)
+  except (ValueError, OverflowError):
+    return None
+  # start_time is naive local time, like datetime.now(); an offset is converted
+  # to local time and dropped, so both bounds compare in the same frame
+  if value.tzinfo is not None:
+    value = value.astimezone().replace(tzinfo=None)
+  return value
+
+def encode_show_cursor(start_time, show_id):
+  return f'{start_time.isoformat()}_{show_id}'
+
+def parse_show_cursor(value):
+  # Cursor format: "<start_time isoformat>_<show id>"
+  if not value:
+    return None
+  try:
+    start_time, show_id = value.rsplit('_', 1)
+    return datetime.fromisoformat(start_time), int(show_id)
+  except ValueError:
+    return None
+
+def encode_directory_cursor(name, owner_id):
+  return f'{name}_{owner_id}'
+
+def parse_directory_cursor(value):
+  # Cursor format: "<name>_<id>"; names may contain underscores, ids do not
+  if not value:
+    return None
+  try:
+    name, owner_id = value.rsplit('_', 1)
+    return name, int(owner_id)
+  except ValueError:
+    return None
+
+def directory_args(keys):
+  # The filters, letter, cursor and page size of a /venues or /artists request
+  filters = { key: request.args.get(key, '').strip() for key in keys }
+  filters = { key: value for key, value in filters.items() if value }
+  limit = min(max(request.args.get('limit', DIRECTORY_PAGE_SIZE, type=int), 1), DIRECTORY_MAX_PAGE_SIZE)
+  letter = request.args.get('letter', '').strip().upper()[:1]
+  if letter not in DIRECTORY_LETTERS:
+    letter = ''
+  return filters, letter, parse_directory_cursor(request.args.get('after')), limit
+
+def directory_queries(model, keys):
+  filters, letter, cursor, limit = directory_args(keys)
+  return { "directory": directory_rows(model, after=cursor, starts_at=letter or None, limit=limit, **filters) }
+
+def directory(rows, endpoint, keys):
+  # Template context for a keyset-paginated /venues or /artists page
+  filters, letter, _, limit = directory_args(keys)
+  has_next = len(rows) > limit
+  rows = rows[:limit]
+
+  next_url = None
+  if has_next:
+    last = rows[-1]
+    next_url = url_for(endpoint, after=encode_directory_cursor(last.name, last.id),
+                       limit=request.args.get('limit'), **filters)
+
+  return dict(directory_form(filters, letter), rows=rows, next_url=next_url)
+
+def directory_form(filters, letter=''):
+  # Template context for the filter form and A-Z links above a directory
+  return {
+    "filters": filters,
+    "letter": letter,
+    "letters": DIRECTORY_LETTERS,
+    "states": STATE_CHOICES,
+    "genres": GENRE_CHOICES
+  }
+
+def search_page_queries(model):
+  # The engine's dialect rather than the session's bind, so asgi.py can build these without a session
+  rows, total = search_queries(model, request.values.get('search_term', ''),
+                               page=request.values.get('page', 1, type=int), per_page=SEARCH_RESULTS_PER_PAGE,
+                               dialect=db.get_engine().dialect.name)
+  return { "matches": rows, "count": total }
+
+def render_search_results(template, results):
+  response = {
+    "count": results['count'][0][0],
+    "data": [{ "id": row.id, "name": row.name, "num_upcoming_shows": row.upcoming_shows_count }
+             for row in results['matches']]
+  }
+  return render_template(template, results=response, search_term=request.values.get('search_term', ''),
+                         page=request.values.get('page', 1, type=int), per_page=SEARCH_RESULTS_PER_PAGE)
+
+def owner_page_queries(model, owner_id):
+  fields, _, _, _, show_rows, _ = DETAILS[model]
+  return {
+    "owner": entity_query(model, owner_id, fields),
+    "genres": genre_names_query(model, owner_id),
+    "shows": show_rows(owner_id)
+  }
 
 def form_data_cleanser(form_data):
   data = {}
@@ -620,15 +835,58 @@ def form_data_cleanser(form_data):
 
 
 
+#----------------------------------------------------------------------------#
+# App Factory.
+#----------------------------------------------------------------------------#
+
+def create_app(config='config', **settings):
+  """Build the app from a config object or import path, with `settings` applied on top.
+
+  Nothing here connects to a database, so the app can be built in a
+  preloading server's master process; see workers.warm_up().
+  """
+  app = Flask(__name__)
+  app.config.from_object(config)
+  app.config.update(settings)
+
+  moment.init_app(app)
+  replica_set.init_app(app)
+  db.init_app(app)
+  migrate.init_app(app, db)
+  init_sql_instrumentation(app)
+  init_metrics(app)
+  page_cache.init_app(app)
+  fragment_cache.init_app(app)
+  init_assets(app)
+  image_store.init_app(app)
+  install_fork_guards()
+
+  app.jinja_env.filters['datetime'] = format_datetime
+  app.register_blueprint(main)
+  app.register_blueprint(api)
+
+  # app.logger is shared by every app built in this process; add the handler once
+  if not app.debug and not any(isinstance(handler, FileHandler) for handler in app.logger.handlers):
+    file_handler = FileHandler('error.log')
+    file_handler.setFormatter(
+      Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    app.logger.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(file_handler)
+    app.logger.info('errors')
+
+  return app
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
 # Default port:
 # if __name__ == '__main__':
-#     app.run()
+#     create_app().run()
 
 # Or specify port manually:
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 3000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
@@ -0,0 +1,469 @@
+import asyncio
+import io
+import json
+import re
+import sys
+import time
+from collections import namedtuple
+
+from a2wsgi import WSGIMiddleware
+from flask import request, session
+from sqlalchemy.engine.url import URL, make_url
+from werkzeug.http import http_date, parse_cookie, parse_date, parse_etags, quote_etag
+from werkzeug.urls import url_decode
+
+import api
+from app import create_app
+from cache import cached_response, page_cache, store_response
+from metrics import REQUEST_LATENCY, REQUESTS_IN_PROGRESS
+from models import *
+from replicas import STICKY_COOKIE
+from search import search_queries
+from workers import warm_up
+
+# ----------------------------------------------------------------------------#
+# ASGI entry point.
+#
+#   uvicorn asgi:application --workers 4
+#
+# The read endpoints run on asyncio: the JSON API, and the HTML listing,
+# search and detail pages, whose views @read_page (queries.py) splits into
+# session-less queries and a renderer. The queries are compiled by SQLAlchemy
+# and executed on an asyncpg pool, or aiosqlite connections for SQLite, so a
+# slow read waits on the event loop instead of holding a thread; a page is
+# then rendered by its Flask view in a request context, through the same page
+# cache. The async reads are spread over the healthy replicas like the
+# @replica_reads views, falling back to the primary, unless
+# ASGI_DATABASE_URL names one database.
+#
+# Everything else, including every write, search form posts and pages with
+# pending flash messages, goes to the Flask app on a pool of
+# ASGI_WSGI_THREADS threads and behaves exactly as under WSGI. Needs the
+# packages in requirements-asgi.txt.
+# ----------------------------------------------------------------------------#
+
+# SQLAlchemy renders numeric parameters as :1; asyncpg expects $1
+_NUMERIC_PARAMETER = re.compile(r'(?<![:\w]):(\d+)')
+
+
+class DatabaseUnavailable(Exception):
+    """The database could not be reached."""
+
+
+class AsyncDatabase:
+    """A pool of async driver connections that runs the statements of session-less queries."""
+
+    def __init__(self, url, size):
+        self.url = make_url(url)
+        self.backend = self.url.get_backend_name()
+        if self.backend not in ('postgresql', 'sqlite'):
+            raise ValueError(f'No async driver for {self.backend} databases')
+        self.dialect = self.url.get_dialect()(paramstyle='numeric' if self.backend == 'postgresql' else 'qmark')
+        self.size = size
+        self._pool = None
+        self._lock = None
+        self._row_types = {}
+
+    async def connect(self):
+        # Created here so it belongs to the server's event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pool is not None:
+                return
+            try:
+                self._pool = await self._create_pool()
+            except (OSError, asyncio.TimeoutError, *self._disconnect_errors()) as e:
+                raise DatabaseUnavailable(f'Cannot connect to {self.url!r}: {e}') from e
+
+    async def _create_pool(self):
+        if self.backend == 'postgresql':
+            import asyncpg
+            url = self.url
+            dsn = str(URL('postgresql', url.username, url.password, url.host, url.port, url.database))
+            return await asyncpg.create_pool(dsn, min_size=1, max_size=self.size)
+        import aiosqlite
+        pool = asyncio.Queue()
+        try:
+            for _ in range(self.size):
+                pool.put_nowait(await aiosqlite.connect(self.url.database))
+        except BaseException:
+            while not pool.empty():
+                await pool.get_nowait().close()
+            raise
+        return pool
+
+    def _disconnect_errors(self):
+        # Errors that mean the server is gone, as opposed to a bad query
+        if self.backend == 'postgresql':
+            import asyncpg
+            return (asyncpg.PostgresConnectionError, asyncpg.ConnectionDoesNotExistError,
+                    asyncpg.CannotConnectNowError)
+        import sqlite3
+        return (sqlite3.OperationalError,)
+
+    async def close(self):
+        if self._pool is None:
+            return
+        if self.backend == 'postgresql':
+            await self._pool.close()
+        else:
+            while not self._pool.empty():
+                await self._pool.get_nowait().close()
+        self._pool = None
+
+    def _compile(self, query):
+        statement = query.statement
+        compiled = statement.compile(dialect=self.dialect)
+        params = compiled.construct_params()
+        args = []
+        for name in compiled.positiontup:
+            processor = self.dialect.type_descriptor(compiled.binds[name].type).bind_processor(self.dialect)
+            args.append(processor(params[name]) if processor else params[name])
+        sql = str(compiled)
+        if self.backend == 'postgresql':
+            sql = _NUMERIC_PARAMETER.sub(r'$\1', sql)
+        return sql, args, list(statement.c)
+
+    def _row_type(self, columns):
+        # Rows get the same field names and Python types as the Query's rows under WSGI.
+        # Unlabelled expressions have per-statement anonymous keys; they are read by position.
+        names = tuple(column.key if column.key.isidentifier() else f'_{index}'
+                      for index, column in enumerate(columns))
+        key = (names, tuple(type(column.type) for column in columns))
+        if key not in self._row_types:
+            self._row_types[key] = (
+                namedtuple('Row', names, rename=True),
+                [self.dialect.type_descriptor(column.type).result_processor(self.dialect, None) for column in columns]
+            )
+        return self._row_types[key]
+
+    async def fetch(self, query):
+        if self._pool is None:
+            await self.connect()
+        sql, args, columns = self._compile(query)
+        if self.backend == 'postgresql':
+            try:
+                async with self._pool.acquire() as connection:
+                    records = await connection.fetch(sql, *args)
+            except (OSError, asyncio.TimeoutError, *self._disconnect_errors()) as e:
+                raise DatabaseUnavailable(f'Lost {self.url!r}: {e}') from e
+        else:
+            connection = await self._pool.get()
+            try:
+                async with connection.execute(sql, args) as cursor:
+                    records = await cursor.fetchall()
+            finally:
+                self._pool.put_nowait(connection)
+
+        row_type, processors = self._row_type(columns)
+        return [row_type(*(process(value) if process else value for process, value in zip(processors, record)))
+                for record in records]
+
+
+async def fetch_all(database, queries):
+    return { name: await database.fetch(query) for name, query in queries.items() }
+
+
+def wsgi_environ(scope):
+    """The WSGI environ of a bodiless ASGI request, enough to push a Flask request context."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class Request:
+    def __init__(self, scope):
+        self.path = scope['path']
+        query_string = scope['query_string'].decode('latin-1')
+        # Matches Flask's request.full_path, so ETags agree between the two modes
+        self.full_path = f'{self.path}?{query_string}'
+        self.args = url_decode(query_string)
+        headers = { name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers'] }
+        self.if_none_match = parse_etags(headers.get('if-none-match'))
+        self.if_modified_since = parse_date(headers.get('if-modified-since'))
+        self.cookies = parse_cookie(headers.get('cookie', ''))
+
+
+def json_response(data, status=200, headers=()):
+    body = (json.dumps(data, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+    return status, [(b'content-type', b'application/json')] + list(headers), body
+
+
+NOT_FOUND = json_response({ "error": "Not found" }, 404)
+
+
+async def conditional(request, version, last_modified, build):
+    """The async counterpart of api.conditional(): 304 if the client's copy is current."""
+    etag = api.etag_for(request.full_path, version)
+    last_modified = last_modified.replace(microsecond=0) if last_modified else None
+    headers = [(b'etag', quote_etag(etag).encode('latin-1')), (b'cache-control', b'no-cache')]
+    if last_modified:
+        headers.append((b'last-modified', http_date(last_modified).encode('latin-1')))
+    if api.is_fresh(etag, last_modified, request.if_none_match, request.if_modified_since):
+        return 304, headers, b''
+    return json_response(await build(), headers=headers)
+
+
+#  Endpoints
+#  ----------------------------------------------------------------
+
+MODELS = { 'venue': Venue, 'artist': Artist }
+
+
+async def list_owners(database, request, kind):
+    model = MODELS[kind]
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = api.page_size(request.args)
+    version, last_modified = api.table_version((await database.fetch(api.table_version_query(model)))[0])
+
+    async def build():
+        return api.serialize_page(await database.fetch(api.listing_query(model, after_id, limit)), limit)
+
+    return await conditional(request, version, last_modified, build)
+
+
+async def search_owners(database, request, kind):
+    model = MODELS[kind]
+    page = request.args.get('page', 1, type=int)
+    limit = api.page_size(request.args)
+    version, last_modified = api.table_version((await database.fetch(api.table_version_query(model)))[0])
+
+    async def build():
+        rows, total = search_queries(model, request.args.get('q', ''), page=page, per_page=limit,
+                                     dialect=database.backend)
+        count = (await database.fetch(total))[0][0]
+        return { "count": count, "data": [row._asdict() for row in await database.fetch(rows)] }
+
+    return await conditional(request, version, last_modified, build)
+
+
+async def get_owner(database, request, kind, owner_id):
+    model, owner_id = MODELS[kind], int(owner_id)
+    fields, counterpart, foreign_key, counterpart_key, show_rows, split = api.DETAILS[model]
+    version = api.detail_version_of((await database.fetch(
+        api.detail_version_query(model, owner_id, counterpart, foreign_key, counterpart_key)))[0])
+    if version is None:
+        return NOT_FOUND
+
+    async def build():
+        data = api.serialize_entity((await database.fetch(api.entity_query(model, owner_id, fields)))[0],
+                                    await database.fetch(api.genre_names_query(model, owner_id)))
+        data.update(api.serialize_shows(split(await database.fetch(show_rows(owner_id)))))
+        return data
+
+    return await conditional(request, *version, build)
+
+
+async def list_shows(database, request):
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = api.page_size(request.args)
+    version, last_modified = api.shows_version((await database.fetch(api.shows_version_query()))[0])
+
+    async def build():
+        rows = await database.fetch(api.shows_page_query(after_id, limit))
+        return api.serialize_page(rows, limit, api.serialize_show)
+
+    return await conditional(request, version, last_modified, build)
+
+
+async def get_show(database, request, show_id):
+    rows = await database.fetch(api.show_query().filter(Show.id == int(show_id)))
+    if not rows:
+        return NOT_FOUND
+
+    async def build():
+        return api.serialize_show(rows[0])
+
+    return await conditional(request, tuple(rows[0]), None, build)
+
+
+# (path, Flask endpoint name for metrics, handler)
+ROUTES = [(re.compile(path), endpoint, handler) for path, endpoint, handler in (
+    (r'/api/v1/(?P<kind>venue|artist)s', 'api.list_{kind}s', list_owners),
+    (r'/api/v1/(?P<kind>venue|artist)s/search', 'api.search_{kind}s', search_owners),
+    (r'/api/v1/(?P<kind>venue|artist)s/(?P<owner_id>\d+)', 'api.get_{kind}', get_owner),
+    (r'/api/v1/shows', 'api.list_shows', list_shows),
+    (r'/api/v1/shows/(?P<show_id>\d+)', 'api.get_show', get_show),
+)]
+
+
+class AsyncApp:
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        size = config.get('ASGI_POOL_SIZE', 20)
+        primary_url = config['SQLALCHEMY_DATABASE_URI']
+        url = config.get('ASGI_DATABASE_URL')
+        # Replica health is shared with the @replica_reads views of this process
+        self.replica_set = app.extensions['replicas'] if not url else None
+        if self.replica_set and self.replica_set.replicas:
+            self.replicas = { replica.url: AsyncDatabase(replica.url, size)
+                              for replica in self.replica_set.replicas }
+            self.reads_from_replica = True
+        else:
+            self.replicas = {}
+            self.reads_from_replica = bool(url) and url != primary_url
+        self.primary = AsyncDatabase(url or primary_url, size)
+        self.wsgi = WSGIMiddleware(app, workers=config.get('ASGI_WSGI_THREADS', 10))
+
+    def _match(self, scope):
+        for pattern, endpoint, handler in ROUTES:
+            match = pattern.fullmatch(scope['path'])
+            if match:
+                return endpoint.format(**match.groupdict()), handler, match.groupdict()
+        return None
+
+    # Werkzeug 1.0 keeps request contexts per thread, not per task, so the
+    # page methods push one only around synchronous steps, never across an await
+
+    def _plan_page(self, environ):
+        """(endpoint, cached response, queries) for a @read_page view, or None to leave the request to Flask."""
+        with self.app.request_context(environ):
+            view = self.app.view_functions.get(request.endpoint)
+            # Pending flash messages are popped from the session by the page, and only Flask saves it
+            if not hasattr(view, 'page_queries') or session.get('_flashes'):
+                return None
+            if getattr(view, 'cached_page', False) and page_cache.enabled:
+                cached = cached_response()
+                if cached is not None:
+                    return request.endpoint, self.app.make_response(cached), None
+            return request.endpoint, None, view.page_queries(**request.view_args)
+
+    def _render_page(self, environ, results):
+        with self.app.request_context(environ):
+            view = self.app.view_functions[request.endpoint]
+            response = view.render_page(results, **request.view_args)
+            if getattr(view, 'cached_page', False) and page_cache.enabled:
+                response = store_response(response)
+            return self.app.make_response(response)
+
+    async def _serve_page(self, scope, receive, send):
+        environ = wsgi_environ(scope)
+        try:
+            plan = self._plan_page(environ)
+            if plan is None:
+                return await self.wsgi(scope, receive, send)
+            endpoint, response, queries = plan
+        except Exception:
+            self.app.logger.exception(f'Error planning {scope["path"]}')
+            return await self.wsgi(scope, receive, send)
+
+        status = 500
+        started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            if response is None:
+                try:
+                    results = await self._read(lambda database: fetch_all(database, queries))
+                    response = self._render_page(environ, results)
+                except Exception:
+                    # Flask renders its own error page for whatever went wrong
+                    self.app.logger.exception(f'Error serving {scope["path"]}; handing it to Flask')
+                    return await self.wsgi(scope, receive, send)
+            status = response.status_code
+            headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                       for name, value in response.get_wsgi_headers(environ).to_wsgi_list()]
+            await send({ 'type': 'http.response.start', 'status': status, 'headers': headers })
+            await send({ 'type': 'http.response.body', 'body': response.get_data() })
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            REQUEST_LATENCY.labels(endpoint, 'GET', status).observe(time.perf_counter() - started)
+
+    def _databases(self):
+        return [*self.replicas.values(), self.primary]
+
+    async def _read(self, read):
+        # An unreachable replica is taken out of rotation and the read retried on the next
+        # healthy one, then on the primary
+        while True:
+            replica = self.replica_set.choose_replica() if self.replicas else None
+            database = self.replicas[replica.url] if replica else self.primary
+            try:
+                return await read(database)
+            except DatabaseUnavailable as e:
+                if replica is None:
+                    raise
+                self.app.logger.warning(f'Replica unavailable, retrying elsewhere: {e}')
+                replica.mark_down()
+
+    async def _connect(self):
+        if not self.replicas:
+            await self.primary.connect()
+            return
+        # The primary's pool is only opened when every replica is down
+        for url, database in self.replicas.items():
+            try:
+                await database.connect()
+            except DatabaseUnavailable as e:
+                self.app.logger.warning(str(e))
+                next(replica for replica in self.replica_set.replicas if replica.url == url).mark_down()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Each worker process imports this module, so there is nothing to share by preloading
+                await asyncio.get_running_loop().run_in_executor(None, warm_up, self.app)
+                await self._connect()
+                await send({ 'type': 'lifespan.startup.complete' })
+            elif message['type'] == 'lifespan.shutdown':
+                for database in self._databases():
+                    await database.close()
+                await send({ 'type': 'lifespan.shutdown.complete' })
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return await self.wsgi(scope, receive, send)
+        request = Request(scope)
+        # Clients pinned to the primary after a write read through Flask, which honours the pin
+        if self.reads_from_replica and STICKY_COOKIE in request.cookies:
+            return await self.wsgi(scope, receive, send)
+        route = self._match(scope)
+        if route is None:
+            return await self._serve_page(scope, receive, send)
+
+        endpoint, handler, params = route
+        status = 500
+        started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            try:
+                status, headers, body = await self._read(lambda database: handler(database, request, **params))
+            except Exception:
+                self.app.logger.exception(f'Error serving {request.full_path}')
+                status, headers, body = json_response({ "error": "Internal server error" }, 500)
+            headers = headers + [(b'content-length', str(len(body)).encode('latin-1'))]
+            await send({ 'type': 'http.response.start', 'status': status, 'headers': headers })
+            await send({ 'type': 'http.response.body', 'body': body })
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            REQUEST_LATENCY.labels(endpoint, 'GET', status).observe(time.perf_counter() - started)
+
+
+application = AsyncApp(create_app())
@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import abort, current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+# ----------------------------------------------------------------------------#
+# Static assets.
+#
+# `flask assets build` concatenates the stylesheets and scripts linked from
+# templates/layouts/main.html into bundles, minifies the CSS and writes each
+# bundle to static/dist under a name carrying a hash of its content, next to
+# gzip and brotli copies. asset_urls() gives templates the hashed URL. A
+# hashed file never changes, so it is served with a year-long immutable
+# Cache-Control, precompressed when the client accepts it. Without a build,
+# or with ASSETS_DEBUG (on with DEBUG), pages link the source files instead.
+# ----------------------------------------------------------------------------#
+
+# Bundle name -> source files under static/, in page order
+BUNDLES = {
+    'main.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css', 'css/main.responsive.css',
+                 'css/main.quickfix.css'],
+    # Loaded in <head>, before the page renders
+    'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    # Deferred, after jQuery
+    'main.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+# (Content-Encoding, file suffix), in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_CSS_STRING_OR_COMMENT = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*(?!!).*?\*/', re.S)
+_CSS_STRING = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', re.S)
+
+
+def minify_css(text):
+    """Drop comments (but not /*! licences */) and the whitespace that carries no meaning."""
+    text = _CSS_STRING_OR_COMMENT.sub(lambda match: match.group(1) or '', text)
+    parts = _CSS_STRING.split(text)
+    for index in range(0, len(parts), 2):
+        code = re.sub(r'\s+', ' ', parts[index])
+        # A space before a colon is a descendant combinator (a :hover); one after it never matters
+        code = re.sub(r' ?([{};,>]) ?', r'\1', code).replace(': ', ':')
+        parts[index] = code.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def _bundle(static_folder, name):
+    sources = []
+    for path in BUNDLES[name]:
+        with open(os.path.join(static_folder, path), encoding='utf-8') as source:
+            sources.append(source.read())
+    if name.endswith('.css'):
+        # dist/ is one level below static/ like css/, so relative url()s still resolve
+        return '\n'.join(minify_css(source) for source in sources)
+    # Scripts are concatenated as they are; the libraries are minified already
+    return '\n;'.join(sources)
+
+
+def _base_name(filename):
+    for _, suffix in ENCODINGS:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+
+def build_assets(static_folder, report=print):
+    """Write every bundle and its compressed copies to static/dist and return the new manifest."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        report('The brotli package is not installed; writing gzip copies only.')
+
+    dist = os.path.join(static_folder, DIST)
+    os.makedirs(dist, exist_ok=True)
+    manifest_path = os.path.join(dist, MANIFEST)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as source:
+            previous = json.load(source)
+
+    manifest = {}
+    for name in BUNDLES:
+        data = _bundle(static_folder, name).encode('utf-8')
+        stem, extension = os.path.splitext(name)
+        filename = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+        manifest[name] = filename
+        path = os.path.join(dist, filename)
+        copies = { '': data, '.gz': gzip.compress(data, 9, mtime=0) }
+        if brotli:
+            copies['.br'] = brotli.compress(data, quality=11)
+        for suffix, content in copies.items():
+            with open(path + suffix, 'wb') as destination:
+                destination.write(content)
+        source_size = sum(os.path.getsize(os.path.join(static_folder, source)) for source in BUNDLES[name])
+        report(f'{filename}: {len(BUNDLES[name])} files, {source_size} -> {len(data)} bytes'
+               + ''.join(f', {suffix[1:]} {len(content)}' for suffix, content in copies.items() if suffix))
+
+    # The previous build stays, for pages rendered before workers pick up the new one
+    kept = set(manifest.values()) | set(previous.values())
+    for filename in os.listdir(dist):
+        if filename != MANIFEST and _base_name(filename) not in kept:
+            os.remove(os.path.join(dist, filename))
+    with open(manifest_path, 'w') as destination:
+        json.dump(manifest, destination, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, DIST, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as source:
+        return json.load(source)
+
+
+def asset_urls(name):
+    """URLs of a bundle for templates: its built file, or its source files."""
+    manifest = current_app.extensions['assets']
+    if name in manifest and not current_app.config.get('ASSETS_DEBUG', current_app.debug):
+        return [url_for('static', filename=f'{DIST}/{manifest[name]}')]
+    return [url_for('static', filename=path) for path in BUNDLES[name]]
+
+
+def serve_built_asset(filename):
+    if filename == MANIFEST:
+        abort(404)
+    dist = os.path.join(current_app.static_folder, DIST)
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(dist, filename + suffix)):
+            response = send_from_directory(dist, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(dist, filename, mimetype=mimetype)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+assets_cli = AppGroup('assets', help='Static asset bundles.')
+
+
+@assets_cli.command('build')
+def build_command():
+    """Concatenate, minify, fingerprint and precompress the bundles into static/dist."""
+    manifest = build_assets(current_app.static_folder, report=click.echo)
+    click.echo(f'Wrote {len(manifest)} bundles; restart the workers to serve them.')
+
+
+def init_assets(app):
+    app.extensions['assets'] = load_manifest(app.static_folder)
+    # More specific than the static route, so it matches first
+    app.add_url_rule(f'{app.static_url_path}/{DIST}/<filename>', 'built_asset', serve_built_asset)
+    app.add_template_global(asset_urls)
+    app.cli.add_command(assets_cli)
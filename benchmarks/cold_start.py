@@ -0,0 +1,135 @@
+"""Measure how long a new worker takes to start and serve its first requests.
+
+    python benchmarks/cold_start.py [--venues 1000] [--runs 5]
+
+A catalog of --venues venues (twice as many artists, fifty shows per venue) is
+seeded into a temporary SQLite database. Each run starts a fresh interpreter
+that imports app.py, calls create_app() and requests a fixed set of pages
+twice through the test client, with the page cache off, in one of three modes:
+
+    cold      nothing is prepared before the first request
+    warm      workers.warm_up() runs first, as in a worker started without --preload
+    preload   warm_up() runs, then the process forks and the child serves the
+              requests, as a worker forked by gunicorn --preload does
+
+Medians over the runs are printed per mode: the import, create_app and
+warm-up times and the total time of the first and second rounds of requests.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ARTISTS_PER_VENUE = 2
+SHOWS_PER_VENUE = 50
+PATHS = ['/', '/venues', '/artists', '/shows', '/venues/1', '/artists/1', '/venues/create',
+         '/api/typeahead?kind=venue&q=bl', '/api/v1/venues']
+MODES = ('cold', 'warm', 'preload')
+PHASES = ('import_ms', 'create_app_ms', 'warm_up_ms', 'first_round_ms', 'second_round_ms')
+
+
+def settings(database):
+    # The seeded shows predate the clock; a rollover on the first request would rewrite them
+    return { 'SQLALCHEMY_DATABASE_URI': database, 'TESTING': True, 'SQL_INSTRUMENTATION': False,
+             'PAGE_CACHE_ENABLED': False, 'COUNTER_ROLLOVER_INTERVAL': 0 }
+
+
+def seed(database, venues):
+    from app import create_app
+    from models import db
+    from seeder import seed_catalog
+
+    app = create_app(**settings(database))
+    with app.app_context():
+        db.create_all()
+        seconds = seed_catalog(venues=venues, artists=venues * ARTISTS_PER_VENUE, shows=venues * SHOWS_PER_VENUE,
+                               seed=venues, report=lambda message: None)
+        db.engine.dispose()
+    print(f'seeded {venues} venues in {seconds:.1f}s', file=sys.stderr)
+
+
+def request_rounds(app):
+    client = app.test_client()
+    timings = {}
+    for phase in ('first_round_ms', 'second_round_ms'):
+        started = time.perf_counter()
+        for path in PATHS:
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f'GET {path} returned {response.status_code}')
+        timings[phase] = (time.perf_counter() - started) * 1000
+    return timings
+
+
+def measure(mode, database):
+    """One run in a fresh interpreter; returns the timings of each phase in milliseconds."""
+    started = time.perf_counter()
+    from app import create_app
+    from workers import warm_up
+    imported = time.perf_counter()
+    app = create_app(**settings(database))
+    created = time.perf_counter()
+    if mode != 'cold':
+        warm_up(app)
+    warmed = time.perf_counter()
+    timings = { 'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+                'warm_up_ms': (warmed - created) * 1000 }
+
+    if mode != 'preload':
+        timings.update(request_rounds(app))
+        return timings
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        with os.fdopen(write_end, 'w') as pipe:
+            pipe.write(json.dumps(request_rounds(app)))
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        timings.update(json.loads(pipe.read()))
+    os.waitpid(pid, 0)
+    return timings
+
+
+def run(mode, database):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, '--database', database],
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=1000, help='venues in the seeded catalog')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per mode')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # flask_wtf turns its Form deprecation warning on for every instantiation
+    warnings.filterwarnings('ignore', message='"flask_wtf.Form" has been renamed')
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.database)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = 'sqlite:///' + os.path.join(directory, 'cold-start.db')
+        seed(database, args.venues)
+        print(f'{"mode":<8} ' + ' '.join(f'{phase:>16}' for phase in PHASES))
+        for mode in MODES:
+            runs = [run(mode, database) for _ in range(args.runs)]
+            medians = [statistics.median(timings[phase] for timings in runs) for phase in PHASES]
+            print(f'{mode:<8} ' + ' '.join(f'{median:>16.1f}' for median in medians))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Compare show start time formatting strategies on a large page of shows.
+
+    python benchmarks/format_datetime.py [--rows 100000]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatting import DATETIME_FORMATS, format_datetime, format_datetimes
+
+
+def legacy_format_datetime(value, format='medium'):
+    # The filter as it was: re-parse the string and let babel resolve everything per call
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, DATETIME_FORMATS[format], locale='en')
+
+
+def timed(label, function, rows, baseline=None):
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    speedup = f'  {baseline / elapsed:6.1f}x' if baseline else ''
+    print(f'{label:<34} {elapsed:8.3f}s {elapsed / rows * 1e6:8.2f} us/row{speedup}')
+    return elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    # Shows start on the hour or half hour, so a page repeats plenty of values
+    start = datetime(2030, 1, 1, 18, 0)
+    start_times = [start + timedelta(minutes=30 * (i % 5000)) for i in range(args.rows)]
+
+    baseline, expected = timed('dateutil + babel (str round trip)',
+                               lambda: [legacy_format_datetime(str(value), 'full') for value in start_times],
+                               args.rows)
+    _, per_row = timed('format_datetime (cached pattern)',
+                       lambda: [format_datetime(value, 'full') for value in start_times], args.rows, baseline)
+    _, batch = timed('format_datetimes (batch)',
+                     lambda: format_datetimes(start_times, 'full'), args.rows, baseline)
+    assert per_row == expected and batch == expected, 'formatters disagree'
+
+
+if __name__ == '__main__':
+    main()
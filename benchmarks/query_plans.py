@@ -0,0 +1,122 @@
+"""Show the query plans and timings of the hot queries with and without the performance indexes.
+
+    python benchmarks/query_plans.py [--database URL] [--repeat 20]
+
+The queries are captured by requesting the listing and detail pages through
+the test client, so they are exactly what app.py runs. The indexes added by
+migration 8a4e6c2f1b37 are then dropped and recreated around the "before"
+run, so point this at a scratch copy of the database, loaded with
+`flask import`, rather than at production.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PERFORMANCE_INDEXES = ('ix_Show_venue_id_start_time', 'ix_Show_artist_id_start_time', 'ix_Show_start_time_id',
+                       'ix_Show_upcoming_start_time', 'ix_Venue_state_city_name',
+                       'ix_artist_genre_artist_id', 'ix_venue_genre_venue_id')
+
+
+def capture_queries(app, db, paths):
+    """Request each path and return the distinct SELECT statements it ran as (statement, parameters)."""
+    captured = {}
+
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')) and not executemany:
+            captured.setdefault(statement, parameters)
+
+    client = app.test_client()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            for path in paths:
+                response = client.get(path)
+                if response.status_code != 200:
+                    print(f'warning: GET {path} returned {response.status_code}', file=sys.stderr)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return list(captured.items())
+
+
+def explain(cursor, dialect, statement, parameters):
+    if dialect == 'postgresql':
+        cursor.execute('EXPLAIN ANALYZE ' + statement, parameters)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    return '\n'.join(row[-1] for row in cursor.fetchall())
+
+
+def timing(cursor, statement, parameters, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(statement, parameters)
+        cursor.fetchall()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def measure(connection, queries, repeat, label):
+    cursor = connection.connection.cursor()
+    dialect = connection.dialect.name
+    # The label keeps SQLite from reusing a statement prepared against the other set of indexes
+    queries = [(f'/* {label} */ {statement}', parameters) for statement, parameters in queries]
+    return [(explain(cursor, dialect, statement, parameters), timing(cursor, statement, parameters, repeat))
+            for statement, parameters in queries]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='database URL (defaults to SQLALCHEMY_DATABASE_URI in config.py)')
+    parser.add_argument('--repeat', type=int, default=20, help='executions per query for the median timing')
+    args = parser.parse_args()
+
+    from app import create_app
+    from cache import page_cache
+    from models import Show, Venue, db
+
+    app = create_app(**({ 'SQLALCHEMY_DATABASE_URI': args.database } if args.database else {}))
+    page_cache.enabled = False
+
+    with app.app_context():
+        venue = db.session.query(Venue.id, Venue.state, Venue.city).order_by(Venue.id).first()
+        show = db.session.query(Show.artist_id).order_by(Show.id).first()
+        if venue is None or show is None:
+            sys.exit('The database has no venues or shows; load some with `flask import` first.')
+        paths = ['/venues', f'/venues?state={venue.state}&city={venue.city}', f'/venues/{venue.id}',
+                 f'/artists/{show.artist_id}', '/shows']
+        indexes = [index for table in db.metadata.tables.values() for index in table.indexes
+                   if index.name in PERFORMANCE_INDEXES]
+
+    queries = capture_queries(app, db, paths)
+
+    with app.app_context():
+        connection = db.engine.connect()
+        try:
+            after = measure(connection, queries, args.repeat, 'with indexes')
+            for index in indexes:
+                index.drop(connection)
+            try:
+                before = measure(connection, queries, args.repeat, 'without indexes')
+            finally:
+                for index in indexes:
+                    index.create(connection)
+        finally:
+            connection.close()
+
+    for (statement, _), (plan_before, before_time), (plan_after, after_time) in zip(queries, before, after):
+        print('=' * 100)
+        print(' '.join(statement.split())[:300])
+        print(f'\n-- without indexes: {before_time * 1000:.3f} ms\n{plan_before}')
+        print(f'\n-- with indexes:    {after_time * 1000:.3f} ms '
+              f'({before_time / after_time if after_time else float("inf"):.1f}x)\n{plan_after}\n')
+
+
+if __name__ == '__main__':
+    main()
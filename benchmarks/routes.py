@@ -0,0 +1,191 @@
+"""Benchmark every view against seeded SQLite databases of increasing size.
+
+    python benchmarks/routes.py [--sizes 1000,10000] [--requests 30] [--output results.json]
+    python benchmarks/routes.py --baseline results.json [--threshold 0.25]
+
+Each size is a venue count; a catalog of that many venues, twice as many
+artists and fifty shows per venue is generated with `flask seed`'s generator
+into a temporary database. Every route is then requested through the test
+client with the page cache off, and its p50/p95 latency, queries per request
+and peak Python memory are recorded. The routes rewritten to avoid per-row
+queries have a fixed query budget (QUERY_BUDGETS) that holds at every size;
+exceeding it fails the run. With --baseline, the run also fails (exit status
+1) when a route's p95 grows by more than the threshold or it runs more
+queries than in the baseline.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ARTISTS_PER_VENUE = 2
+SHOWS_PER_VENUE = 50
+# Route -> most queries per request, whatever the catalog size
+QUERY_BUDGETS = {
+    'venues': 1,
+    'venues_area': 1,
+    'venues_letter': 1,
+    'artists': 1,
+    'shows': 1,
+    'show_venue': 3,
+    'show_artist': 3,
+}
+
+
+def routes(venue, artist):
+    """(name, method, path, form data) for every view, against the given venue and artist rows."""
+    venue_form = {
+        'name': 'Benchmark Hall', 'city': venue.city, 'state': venue.state, 'address': '1 Main St',
+        'phone': '555-555-5555', 'genres': ['Jazz', 'Folk'], 'facebook_link': 'https://facebook.com/hall',
+        'image_link': '', 'website_link': '', 'seeking_description': ''
+    }
+    artist_form = {
+        'name': 'Benchmark Band', 'city': artist.city, 'state': artist.state, 'phone': '555-555-5555',
+        'genres': ['Rock n Roll'], 'facebook_link': '', 'image_link': '', 'website_link': '',
+        'seeking_description': ''
+    }
+    return [
+        ('index', 'GET', '/', None),
+        ('venues', 'GET', '/venues', None),
+        ('venues_area', 'GET', f'/venues?state={venue.state}&city={venue.city}', None),
+        ('venues_letter', 'GET', '/venues?letter=M', None),
+        ('artists', 'GET', '/artists', None),
+        ('shows', 'GET', '/shows', None),
+        ('search_venues', 'POST', '/venues/search', { 'search_term': 'blue' }),
+        ('search_artists', 'POST', '/artists/search', { 'search_term': 'the' }),
+        ('show_venue', 'GET', f'/venues/{venue.id}', None),
+        ('show_artist', 'GET', f'/artists/{artist.id}', None),
+        ('create_venue', 'POST', '/venues/create', venue_form),
+        ('edit_venue', 'POST', f'/venues/{venue.id}/edit', dict(venue_form, name=venue.name)),
+        ('create_artist', 'POST', '/artists/create', artist_form),
+        ('edit_artist', 'POST', f'/artists/{artist.id}/edit', dict(artist_form, name=artist.name)),
+        ('create_show', 'POST', '/shows/create',
+         { 'venue_id': venue.id, 'artist_id': artist.id, 'start_time': '2031-06-01 20:00:00' }),
+    ]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def measure_route(client, name, method, path, data, requests):
+    from instrumentation import query_budget
+
+    send = client.get if method == 'GET' else client.post
+    # Untimed first request, so template compilation is not counted
+    send(path, data=data)
+    latencies = []
+    queries = []
+    for _ in range(requests):
+        try:
+            with query_budget(QUERY_BUDGETS.get(name, float('inf'))) as stats:
+                started = time.perf_counter()
+                response = send(path, data=data)
+                latencies.append(time.perf_counter() - started)
+        except AssertionError as e:
+            raise RuntimeError(f'{method} {path} is over its query budget: {e}')
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status_code}')
+        queries.append(stats.count)
+
+    tracemalloc.start()
+    send(path, data=data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "queries": max(queries),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run_size(app, venues, requests, directory):
+    from cache import page_cache
+    from genres import invalidate_genre_cache
+    from models import Artist, Venue, db
+    from seeder import seed_catalog
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(directory, f'routes-{venues}.db')
+    invalidate_genre_cache()
+    with app.app_context():
+        db.create_all()
+        seconds = seed_catalog(venues=venues, artists=venues * ARTISTS_PER_VENUE,
+                               shows=venues * SHOWS_PER_VENUE, seed=venues, report=lambda message: None)
+        print(f'seeded {venues} venues in {seconds:.1f}s', file=sys.stderr)
+        # The busiest venue and artist are the detail pages that regress first
+        venue = Venue.query.order_by((Venue.past_shows_count + Venue.upcoming_shows_count).desc()).first()
+        artist = Artist.query.order_by((Artist.past_shows_count + Artist.upcoming_shows_count).desc()).first()
+        db.session.expunge_all()
+
+    page_cache.enabled = False
+    client = app.test_client()
+    results = {}
+    for name, method, path, data in routes(venue, artist):
+        results[name] = measure_route(client, name, method, path, data, requests)
+        print(f'{venues:>8} {name:<16} {results[name]}', file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for size, routes_ in results.items():
+        for name, current in routes_.items():
+            previous = baseline.get(size, {}).get(name)
+            if previous is None:
+                continue
+            if current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+                regressions.append(f'{size} {name}: p95 {previous["p95_ms"]}ms -> {current["p95_ms"]}ms')
+            if current["queries"] > previous["queries"]:
+                regressions.append(f'{size} {name}: {previous["queries"]} -> {current["queries"]} queries')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000', help='comma-separated venue counts')
+    parser.add_argument('--requests', type=int, default=30, help='timed requests per route')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative p95 growth')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    # flask_wtf turns its Form deprecation warning on for every instantiation
+    warnings.filterwarnings('ignore', message='"flask_wtf.Form" has been renamed')
+
+    # The in-process counter rollover would land its queries in whichever request triggers it
+    app = create_app(TESTING=True, WTF_CSRF_ENABLED=False, SQL_INSTRUMENTATION=False, COUNTER_ROLLOVER_INTERVAL=0)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (int(size) for size in args.sizes.split(',')):
+            results[str(size)] = run_size(app, size, args.requests, directory)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as destination:
+            destination.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as source:
+            regressions = compare(results, json.load(source), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Compare concurrent-connection throughput of the WSGI and ASGI serving modes.
+
+    python benchmarks/serving.py [--venues 1000] [--connections 10,50,200] [--duration 10]
+    python benchmarks/serving.py --database postgresql://localhost:5432/appfyyur_bench
+
+A catalog of --venues venues (twice as many artists, fifty shows per venue) is
+seeded into a temporary SQLite database, unless --database names an existing,
+already seeded one. The app is then served twice on local ports, each in its
+own process: by the threaded Werkzeug server that `python app.py` starts, and
+by uvicorn running asgi:application. For each connection count, that many
+keep-alive clients request a mix of JSON API reads and HTML pages for
+--duration seconds, with the page cache off so every request reads the
+database; requests per second and p50/p99 latency are printed for each mode.
+The clients share one process, so at high connection counts they can become
+the limit; compare the modes at the same settings only.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ARTISTS_PER_VENUE = 2
+SHOWS_PER_VENUE = 50
+HOST = '127.0.0.1'
+
+
+def build_app(database):
+    from app import create_app
+
+    # The seeded shows predate the clock; a rollover mid-run would rewrite them
+    return create_app(SQLALCHEMY_DATABASE_URI=database, SQL_INSTRUMENTATION=False, DEBUG=False,
+                      PAGE_CACHE_ENABLED=False, COUNTER_ROLLOVER_INTERVAL=0)
+
+
+def serve_wsgi(database, port):
+    import logging
+
+    app = build_app(database)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app.run(host=HOST, port=port, threaded=True, debug=False, use_reloader=False)
+
+
+def serve_asgi(database, port):
+    import uvicorn
+    from asgi import AsyncApp
+
+    uvicorn.run(AsyncApp(build_app(database)), host=HOST, port=port, log_level='warning', access_log=False)
+
+
+MODES = { 'wsgi': serve_wsgi, 'asgi': serve_asgi }
+
+
+def seed(database, venues):
+    from models import db
+    from seeder import seed_catalog
+
+    app = build_app(database)
+    with app.app_context():
+        db.create_all()
+        seconds = seed_catalog(venues=venues, artists=venues * ARTISTS_PER_VENUE, shows=venues * SHOWS_PER_VENUE,
+                               seed=venues, report=lambda message: None)
+        db.engine.dispose()
+    print(f'seeded {venues} venues in {seconds:.1f}s', file=sys.stderr)
+
+
+def request_paths(venues, rng, count=200):
+    """A fixed mix of listing, detail and search reads, as JSON and as pages."""
+    artists = venues * ARTISTS_PER_VENUE
+    paths = []
+    for _ in range(count):
+        paths += [
+            f'/api/v1/venues?after_id={rng.randrange(venues)}',
+            f'/api/v1/venues/{rng.randrange(1, venues + 1)}',
+            f'/api/v1/artists/{rng.randrange(1, artists + 1)}',
+            f'/api/v1/shows?after_id={rng.randrange(venues * SHOWS_PER_VENUE)}',
+            '/api/v1/artists/search?q=the',
+            f'/venues?letter={rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ")}',
+            f'/venues/{rng.randrange(1, venues + 1)}',
+            f'/artists/{rng.randrange(1, artists + 1)}',
+            '/artists/search?search_term=the',
+        ]
+    rng.shuffle(paths)
+    return paths
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    version, status = lines[0].split(' ')[:2]
+    headers = dict(line.lower().split(': ', 1) for line in lines[1:] if line)
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+    keep_alive = version == 'HTTP/1.1' and headers.get('connection') != 'close'
+    return int(status), keep_alive
+
+
+async def _client(port, paths, deadline, latencies, errors):
+    reader = writer = None
+    position = random.randrange(len(paths))
+    while time.perf_counter() < deadline:
+        path = paths[position % len(paths)]
+        position += 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(HOST, port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {HOST}\r\n\r\n'.encode('latin-1'))
+            status, keep_alive = await _read_response(reader)
+        except (OSError, asyncio.IncompleteReadError):
+            errors.append(path)
+            status, keep_alive = None, False
+        if status is not None:
+            latencies.append(time.perf_counter() - started)
+            if status >= 500:
+                errors.append(path)
+        if not keep_alive and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, paths, connections, duration):
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(port, paths, started + duration, latencies, errors)
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies) or [0]
+    return {
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p99_ms": round(ordered[min(int(0.99 * len(ordered)), len(ordered) - 1)] * 1000, 2),
+        "errors": len(errors),
+    }
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind((HOST, 0))
+        return probe.getsockname()[1]
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def run_mode(mode, database, paths, connection_counts, duration):
+    port = _free_port()
+    # Spawned, not forked, so the server starts from a clean interpreter like a real deployment
+    server = multiprocessing.get_context('spawn').Process(target=MODES[mode], args=(database, port), daemon=True)
+    server.start()
+    try:
+        _wait_for(port)
+        # Warm up connections, templates and caches
+        asyncio.run(load(port, paths, 4, 1))
+        results = {}
+        for connections in connection_counts:
+            results[str(connections)] = asyncio.run(load(port, paths, connections, duration))
+            print(f'{mode} {connections:>5} connections {results[str(connections)]}', file=sys.stderr)
+        return results
+    finally:
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=1000, help='venues to seed into the temporary database')
+    parser.add_argument('--database', help='URL of an already seeded database to serve instead')
+    parser.add_argument('--connections', default='10,50,200', help='comma-separated concurrent connection counts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per connection count')
+    parser.add_argument('--modes', default='wsgi,asgi', help='comma-separated modes to run')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    connection_counts = [int(count) for count in args.connections.split(',')]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        database = args.database
+        venues = args.venues
+        if database is None:
+            database = 'sqlite:///' + os.path.join(directory, 'serving.db')
+            seed(database, venues)
+        paths = request_paths(venues, random.Random(venues))
+        for mode in args.modes.split(','):
+            results[mode] = run_mode(mode, database, paths, connection_counts, args.duration)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as destination:
+            destination.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
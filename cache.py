@@ -0,0 +1,197 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, request, session
+
+from metrics import record_cache_lookup
+
+# ----------------------------------------------------------------------------#
+# Page cache.
+#
+# Rendered GET responses are stored under their full path together with the
+# version of every tag the page depends on (venues, venue:12, artist:7, ...).
+# Invalidating a tag bumps its version, which turns
+# every entry that recorded the old version into a miss. Entries live in a
+# size-bounded in-process LRU by default; RedisBackend shares them between
+# workers.
+# ----------------------------------------------------------------------------#
+
+class MemoryBackend:
+    """Thread-safe LRU bounded by the total size of the stored bodies."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tag_versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, size):
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[-1]
+            self._entries[key] = entry + (size,)
+            self.size += size
+            while self.size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted[-1]
+                self.evictions += 1
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return [self._tag_versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class RedisBackend:
+    """Shared backend for multi-worker deployments, on the `redis` package in requirements.txt."""
+
+    def __init__(self, url, timeout=300, prefix='fyyur:page:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.timeout = timeout
+        self.prefix = prefix
+        self.size = None
+        self.evictions = None
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, entry, size):
+        self.client.set(self.prefix + key, pickle.dumps(entry + (size,)), ex=self.timeout)
+
+    def tag_versions(self, tags):
+        if not tags:
+            return []
+        return [int(value or 0) for value in self.client.mget([f'{self.prefix}tag:{tag}' for tag in tags])]
+
+    def bump(self, tags):
+        pipeline = self.client.pipeline()
+        for tag in tags:
+            pipeline.incr(f'{self.prefix}tag:{tag}')
+        pipeline.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class PageCache:
+    def __init__(self, backend=None, timeout=300):
+        self.backend = backend or MemoryBackend()
+        self.timeout = timeout
+        self.enabled = True
+        self.hits = self.misses = self.stores = self.invalidations = 0
+
+    def init_app(self, app):
+        url = app.config.get('PAGE_CACHE_URL')
+        self.timeout = app.config.get('PAGE_CACHE_TIMEOUT', self.timeout)
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+        if url:
+            self.backend = RedisBackend(url, timeout=self.timeout)
+        else:
+            self.backend = MemoryBackend(app.config.get('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+    def lookup(self, key):
+        entry = self.backend.get(key)
+        if entry is not None:
+            tags, versions, stored_at, body, mimetype = entry[:5]
+            fresh = time.time() - stored_at < self.timeout
+            if fresh and self.backend.tag_versions(tags) == versions:
+                self.hits += 1
+                record_cache_lookup('page', True)
+                return body, mimetype
+        self.misses += 1
+        record_cache_lookup('page', False)
+        return None
+
+    def store(self, key, tags, body, mimetype):
+        tags = sorted(set(tags))
+        versions = self.backend.tag_versions(tags)
+        self.backend.set(key, (tags, versions, time.time(), body, mimetype), len(body))
+        self.stores += 1
+
+    def invalidate(self, *tags):
+        tags = [tag for tag in tags if tag]
+        if tags:
+            self.backend.bump(tags)
+            self.invalidations += len(tags)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "evictions": self.backend.evictions,
+            "size_bytes": self.backend.size,
+        }
+
+
+page_cache = PageCache()
+
+
+def tag_page(*tags):
+    """Record the tags the page being rendered depends on."""
+    g.setdefault('page_tags', set()).update(tags)
+
+
+def cached_response():
+    """The current request's page from the cache as a view return value, or None."""
+    cached = page_cache.lookup(request.full_path)
+    if cached is None:
+        return None
+    body, mimetype = cached
+    return body, 200, { 'Content-Type': mimetype, 'X-Page-Cache': 'hit' }
+
+
+def store_response(response):
+    """Cache a view's successful response to the current request under the tags it recorded, and return it."""
+    if isinstance(response, str):
+        body, status, mimetype = response, 200, 'text/html; charset=utf-8'
+    elif hasattr(response, 'status_code'):
+        body, status, mimetype = response.get_data(as_text=True), response.status_code, response.content_type
+    else:
+        return response
+    if status == 200 and g.get('page_tags'):
+        page_cache.store(request.full_path, g.page_tags, body, mimetype)
+    return response
+
+
+def cached_page(view):
+    """Serve GET requests from the page cache, storing successful responses with their tags."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Pending flash messages are rendered into the page, so bypass the cache
+        if not page_cache.enabled or request.method != 'GET' or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        cached = cached_response()
+        if cached is not None:
+            return cached
+        return store_response(view(*args, **kwargs))
+    wrapper.cached_page = True
+    return wrapper
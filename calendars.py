@@ -0,0 +1,85 @@
+from models import *
+
+# ----------------------------------------------------------------------------#
+# Calendars.
+#
+# Shows in a time window, read with a range scan on one of the start_time
+# indexes: (venue_id, start_time), (artist_id, start_time) or
+# (start_time, id). Per-venue and per-artist iCalendar feeds are streamed in
+# chunks from yield_per, like the exports. Show times are stored without a
+# zone, so the feeds use floating local times.
+# ----------------------------------------------------------------------------#
+
+CALENDAR_BATCH_SIZE = 500
+EVENTS_PER_CHUNK = 100
+PRODID = '-//Fyyur//Shows//EN'
+
+
+def calendar_query(date_from, date_to=None, venue_id=None, artist_id=None, state=None):
+    query = db.session.query(
+        Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+        Venue.address, Venue.city, Venue.state, Show.artist_id, Artist.name.label('artist_name')
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+    query = query.filter(Show.start_time >= date_from)
+    if date_to:
+        query = query.filter(Show.start_time < date_to)
+    if venue_id:
+        query = query.filter(Show.venue_id == venue_id)
+    if artist_id:
+        query = query.filter(Show.artist_id == artist_id)
+    if state:
+        query = query.filter(Venue.state == state)
+    return query.order_by(Show.start_time, Show.id)
+
+
+def _escape(text):
+    # RFC 5545 TEXT values: backslash, semicolon, comma and newline are escaped
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold(line):
+    # Content lines are at most 75 octets; continuations start with a space
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts = []
+    while data:
+        size = 75 if not parts else 74
+        # Never split a multi-byte character
+        while size < len(data) and (data[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(data[:size].decode('utf-8'))
+        data = data[size:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _event(row, stamp, host):
+    location = ', '.join(part for part in (row.address, row.city, row.state) if part)
+    lines = (
+        'BEGIN:VEVENT',
+        f'UID:show-{row.id}@{host}',
+        f'DTSTAMP:{stamp}',
+        f'DTSTART:{row.start_time:%Y%m%dT%H%M%S}',
+        f'SUMMARY:{_escape(f"{row.artist_name} at {row.venue_name}")}',
+        f'LOCATION:{_escape(location)}',
+        'END:VEVENT',
+    )
+    return ''.join(_fold(line) for line in lines)
+
+
+def ics_stream(query, name, last_modified, host):
+    """Generate the iCalendar feed of `query`'s shows as bytes."""
+    stamp = f'{last_modified:%Y%m%dT%H%M%S}Z'
+    header = ('BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN',
+              f'X-WR-CALNAME:{_escape(name)}')
+    # The header goes out before the query runs
+    yield ''.join(_fold(line) for line in header).encode('utf-8')
+
+    chunk = []
+    for row in query.yield_per(CALENDAR_BATCH_SIZE):
+        chunk.append(_event(row, stamp, host))
+        if len(chunk) == EVENTS_PER_CHUNK:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+    chunk.append(_fold('END:VCALENDAR'))
+    yield ''.join(chunk).encode('utf-8')
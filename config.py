@@ -10,3 +10,66 @@ SQLALCHEMY_TRACK_MODIFICATIONS = False
 
 # TODO IMPLEMENT DATABASE URL
 SQLALCHEMY_DATABASE_URI = 'postgresql://mobolajiolawale@localhost:5432/appfyyur'
+
+# Seconds between in-process show counter rollovers (0 disables; use the
+# `flask rollover-counters` command from cron instead). Only requests served
+# by Flask trigger them, so under asgi.py prefer the cron job.
+COUNTER_ROLLOVER_INTERVAL = 60
+
+# Seconds before a worker rebuilds its typeahead index to pick up writes
+# made by other workers
+TYPEAHEAD_REFRESH_INTERVAL = 300
+
+# Rendered page cache. Leave PAGE_CACHE_URL unset for the per-process LRU, or
+# point it at Redis (e.g. 'redis://localhost:6379/0') to share it between workers
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_TIMEOUT = 300
+PAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+PAGE_CACHE_URL = os.environ.get('PAGE_CACHE_URL')
+
+# Rendered show tiles and directory rows, per process, keyed on the version of
+# what they display
+FRAGMENT_CACHE_ENABLED = True
+FRAGMENT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Compiled templates are cached on disk and shared by every worker; leave the
+# directory unset for a per-user one under the system temp dir
+TEMPLATE_BYTECODE_CACHE = True
+TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR')
+
+# Uploaded and ingested venue and artist images, and their thumbnails; the
+# thumbnail cache drops the least recently used ones beyond its cap
+IMAGE_STORE_DIR = os.environ.get('IMAGE_STORE_DIR') or os.path.join(basedir, 'media')
+IMAGE_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Link the static source files instead of the bundles built by
+# `flask assets build`, so edits show up without a rebuild
+ASSETS_DEBUG = DEBUG
+
+# Read replicas for the listing, search and detail views. Entries are URLs or
+# dicts with a 'url' plus any of pool_size, max_overflow, pool_recycle,
+# pool_timeout, pool_pre_ping and statement_timeout (milliseconds, PostgreSQL
+# only), e.g.
+#   {'url': 'postgresql://localhost:5432/appfyyur_replica', 'pool_size': 10, 'statement_timeout': 5000}
+# DATABASE_PRIMARY_OPTIONS takes the same keys for the primary.
+DATABASE_PRIMARY_OPTIONS = {}
+DATABASE_REPLICAS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+# Seconds a client reads from the primary after writing, to see its own changes
+REPLICA_STICKY_SECONDS = 5
+# Seconds an unreachable replica is left out of rotation
+REPLICA_RETRY_INTERVAL = 30
+
+# Report each request's query count and database time as Server-Timing headers
+SQL_INSTRUMENTATION = True
+# Log a possible N+1 when one statement shape runs more often than this in a request
+SQL_REPEAT_THRESHOLD = 5
+
+# ASGI mode (asgi.py, packages in requirements-asgi.txt). The JSON API reads
+# use async driver pools of ASGI_POOL_SIZE connections per database: one to
+# ASGI_DATABASE_URL if set, otherwise one per replica, taken in turn while
+# healthy, and one to the primary as fallback. Other requests run the Flask
+# app on ASGI_WSGI_THREADS threads.
+ASGI_DATABASE_URL = os.environ.get('ASGI_DATABASE_URL')
+ASGI_POOL_SIZE = 20
+ASGI_WSGI_THREADS = 10
@@ -0,0 +1,103 @@
+from datetime import datetime
+
+from models import *
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue and Artist carry denormalized upcoming_shows_count/past_shows_count
+# columns so listings never have to count shows. Show.upcoming records which
+# counter a show is currently in; inserts and deletes adjust the counters in
+# the same transaction, and rollover_show_counters() moves shows whose
+# start_time has passed from the upcoming to the past counter.
+# ----------------------------------------------------------------------------#
+
+COUNTED = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+ROLLOVER_BATCH_SIZE = 1000
+
+
+def _adjust(connection, target, delta):
+    counter = 'upcoming_shows_count' if target.upcoming else 'past_shows_count'
+    for model, _ in COUNTED:
+        owner_id = target.venue_id if model is Venue else target.artist_id
+        column = getattr(model, counter)
+        connection.execute(
+            model.__table__.update().where(model.id == owner_id)
+            .values({counter: column + delta, 'updated_at': datetime.utcnow()})
+        )
+
+
+@db.event.listens_for(Show, 'before_insert')
+def _classify_show(mapper, connection, target):
+    target.upcoming = target.start_time > datetime.now()
+
+
+@db.event.listens_for(Show, 'after_insert')
+def _count_show(mapper, connection, target):
+    _adjust(connection, target, 1)
+
+
+@db.event.listens_for(Show, 'after_delete')
+def _uncount_show(mapper, connection, target):
+    _adjust(connection, target, -1)
+
+
+def recount_show_counters(connection, owner_ids=None):
+    """Recompute both counters from Show.upcoming for the given {model: ids} owners, or all of them."""
+    for model, foreign_key in COUNTED:
+        ids = None if owner_ids is None else owner_ids[model]
+        if ids is not None and not ids:
+            continue
+
+        def count(upcoming):
+            return db.select([db.func.count(Show.id)]) \
+                .where(foreign_key == model.id) \
+                .where(Show.upcoming == upcoming) \
+                .as_scalar()
+
+        update = model.__table__.update().values(
+            upcoming_shows_count=count(True), past_shows_count=count(False), updated_at=datetime.utcnow()
+        )
+        if ids is not None:
+            update = update.where(model.id.in_(ids))
+        connection.execute(update)
+
+
+def rollover_show_counters(now=None, on_moved=None):
+    """Move shows that have started since the last run into the past counters. Returns the number moved.
+
+    on_moved, if given, is called with the {Venue: ids, Artist: ids} touched by each committed batch.
+    """
+    now = now or datetime.now()
+    moved = 0
+    while True:
+        with db.engine.begin() as connection:
+            due = connection.execute(
+                db.select([Show.id, Show.venue_id, Show.artist_id])
+                .where(Show.upcoming == db.true())
+                .where(Show.start_time <= now)
+                .limit(ROLLOVER_BATCH_SIZE)
+            ).fetchall()
+            if not due:
+                return moved
+
+            connection.execute(
+                Show.__table__.update().where(Show.id.in_([row.id for row in due])).values(upcoming=False)
+            )
+            # Recounting the touched owners keeps concurrent runs from double counting
+            owners = {
+                Venue: {row.venue_id for row in due},
+                Artist: {row.artist_id for row in due}
+            }
+            recount_show_counters(connection, owners)
+        moved += len(due)
+        if on_moved:
+            on_moved(owners)
+
+
+def rebuild_show_counters(now=None):
+    """Reclassify every show and recompute all venue and artist counters from scratch."""
+    now = now or datetime.now()
+    with db.engine.begin() as connection:
+        connection.execute(Show.__table__.update().values(upcoming=Show.start_time > now))
+        recount_show_counters(connection)
@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import zlib
+
+from models import *
+
+# ----------------------------------------------------------------------------#
+# Export.
+#
+# Rows are streamed from a server-side cursor (yield_per) and encoded in small
+# chunks, so memory stays flat however many rows are exported. The CSV
+# columns match what `flask import` reads, genres included.
+# ----------------------------------------------------------------------------#
+
+EXPORT_KINDS = ('venues', 'artists', 'shows')
+EXPORT_FORMATS = ('csv', 'ndjson')
+EXPORT_BATCH_SIZE = 1000
+ROWS_PER_CHUNK = 200
+
+
+def _genre_list(association, foreign_key, model):
+    # Genre names of each row as one "a;b" string, aggregated in SQL to avoid a query per row
+    if db.session.bind.dialect.name == 'postgresql':
+        aggregate = db.func.string_agg(Genre.name, db.literal_column("';'"))
+    else:
+        aggregate = db.func.group_concat(Genre.name, ';')
+    return db.select([aggregate]) \
+        .select_from(association.join(Genre, Genre.id == association.c.genre_id)) \
+        .where(association.c[foreign_key] == model.id) \
+        .as_scalar().label('genres')
+
+
+def _filter_genre(query, association, foreign_key, model, genre):
+    return query.filter(model.id.in_(
+        db.select([association.c[foreign_key]])
+        .select_from(association.join(Genre, Genre.id == association.c.genre_id))
+        .where(Genre.name == genre)
+    ))
+
+
+def export_query(kind, date_from=None, date_to=None, state=None, genre=None):
+    if kind == 'venues':
+        query = db.session.query(
+            Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+            Venue.website, Venue.facebook_link, Venue.image_link, Venue.seeking_talent,
+            Venue.seeking_description, _genre_list(venue_genre, 'venue_id', Venue)
+        )
+        if state:
+            query = query.filter(Venue.state == state)
+        if genre:
+            query = _filter_genre(query, venue_genre, 'venue_id', Venue, genre)
+        return query.order_by(Venue.id)
+
+    if kind == 'artists':
+        query = db.session.query(
+            Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone, Artist.website,
+            Artist.facebook_link, Artist.image_link, Artist.seeking_venue,
+            Artist.seeking_description, _genre_list(artist_genre, 'artist_id', Artist)
+        )
+        if state:
+            query = query.filter(Artist.state == state)
+        if genre:
+            query = _filter_genre(query, artist_genre, 'artist_id', Artist, genre)
+        return query.order_by(Artist.id)
+
+    query = db.session.query(
+        Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+        Show.artist_id, Artist.name.label('artist_name')
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+    if date_from:
+        query = query.filter(Show.start_time >= date_from)
+    if date_to:
+        query = query.filter(Show.start_time < date_to)
+    if state:
+        query = query.filter(Venue.state == state)
+    if genre:
+        query = _filter_genre(query, artist_genre, 'artist_id', Artist, genre)
+    return query.order_by(Show.start_time, Show.id)
+
+
+def _encode_csv(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column['name'] for column in query.column_descriptions])
+    # The header goes out before the query runs, so the first byte is immediate
+    yield buffer.getvalue()
+
+    rows = iter(query.yield_per(EXPORT_BATCH_SIZE))
+    while True:
+        buffer.seek(0)
+        buffer.truncate()
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            if count == ROWS_PER_CHUNK:
+                break
+        if not count:
+            return
+        yield buffer.getvalue()
+
+
+def _encode_ndjson(query):
+    chunk = []
+    for row in query.yield_per(EXPORT_BATCH_SIZE):
+        chunk.append(json.dumps(row._asdict(), default=str))
+        if len(chunk) == ROWS_PER_CHUNK:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(kind, fmt='csv', compress=False, **filters):
+    """Generate the encoded (and optionally gzipped) export of `kind` as bytes."""
+    query = export_query(kind, **filters)
+    chunks = (chunk.encode('utf-8') for chunk in (_encode_csv if fmt == 'csv' else _encode_ndjson)(query))
+    return _gzip(chunks) if compress else chunks
@@ -0,0 +1,58 @@
+import threading
+from datetime import datetime
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import parse_pattern
+
+# ----------------------------------------------------------------------------#
+# Date formatting.
+#
+# babel.dates.format_datetime parses its locale and normalizes the time zone
+# on every call. The patterns used here have no time zone fields, so the
+# compiled pattern and parsed locale are cached per (format, locale) and
+# applied to the datetime directly. format_datetimes formats a whole column,
+# formatting each distinct value once.
+# ----------------------------------------------------------------------------#
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+DEFAULT_LOCALE = 'en'
+
+_patterns = {}
+_patterns_lock = threading.Lock()
+
+
+def compiled_pattern(format='medium', locale=DEFAULT_LOCALE):
+    """Return the (DateTimePattern, Locale) pair for a named or custom format."""
+    key = (format, locale)
+    compiled = _patterns.get(key)
+    if compiled is None:
+        compiled = (parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale))
+        with _patterns_lock:
+            _patterns[key] = compiled
+    return compiled
+
+
+def _as_datetime(value):
+    return value if isinstance(value, datetime) else dateutil.parser.parse(value)
+
+
+def format_datetime(value, format='medium', locale=DEFAULT_LOCALE):
+    pattern, parsed_locale = compiled_pattern(format, locale)
+    return pattern.apply(_as_datetime(value), parsed_locale)
+
+
+def format_datetimes(values, format='medium', locale=DEFAULT_LOCALE):
+    """Format a sequence of datetimes, returning a list in the same order."""
+    pattern, parsed_locale = compiled_pattern(format, locale)
+    formatted = {}
+    result = []
+    for value in values:
+        text = formatted.get(value)
+        if text is None:
+            text = formatted[value] = pattern.apply(_as_datetime(value), parsed_locale)
+        result.append(text)
+    return result
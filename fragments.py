@@ -0,0 +1,94 @@
+import os
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import MemoryBackend
+from metrics import record_cache_lookup
+
+# ----------------------------------------------------------------------------#
+# Template caches.
+#
+# Compiled templates are kept in a filesystem bytecode cache, so a new worker
+# loads them instead of compiling them again. Repeated blocks of a page, such
+# as a show tile or a directory row, are rendered once per version of what
+# they display and then served from an in-process LRU:
+#
+#   {% cache 'venue-row', venue.id, venue.updated_at %} ... {% endcache %}
+#
+# The values after the tag form the key together with the template and line,
+# so a fragment is reused until one of them changes. They must cover
+# everything the block renders; old versions are simply evicted.
+# ----------------------------------------------------------------------------#
+
+class FragmentCache:
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.backend = MemoryBackend(max_bytes)
+        self.enabled = True
+        self.hits = self.misses = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('FRAGMENT_CACHE_ENABLED', True)
+        self.backend = MemoryBackend(app.config.get('FRAGMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+
+        if app.config.get('TEMPLATE_BYTECODE_CACHE', True):
+            directory = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Without a directory, Jinja uses a per-user one under the system temp dir
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    def render(self, key, render):
+        if not self.enabled:
+            return render()
+        entry = self.backend.get(key)
+        record_cache_lookup('fragment', entry is not None)
+        if entry is not None:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        body = render()
+        self.backend.set(key, (body,), len(body))
+        return body
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.backend.evictions,
+            "size_bytes": self.backend.size,
+        }
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # The block's position tells apart fragments that share key values
+        key = [nodes.Const(parser.name), nodes.Const(lineno)]
+        while parser.stream.current.type != 'block_end':
+            if len(key) > 2:
+                parser.stream.expect('comma')
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.Tuple(key, 'load')]), [], [], body) \
+            .set_lineno(lineno)
+
+    def _render(self, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        return Markup(cache.render(key, lambda: str(caller())))
@@ -0,0 +1,102 @@
+import threading
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from metrics import record_cache_lookup
+from models import *
+
+# ----------------------------------------------------------------------------#
+# Genres.
+#
+# A process-wide name -> id cache in front of the Genre table. Missing names
+# are created with a single INSERT ... ON CONFLICT DO NOTHING (INSERT OR
+# IGNORE on SQLite) against the unique index on Genre.name, so concurrent
+# submissions can never create duplicates.
+# ----------------------------------------------------------------------------#
+
+_genre_ids = {}
+_lock = threading.Lock()
+
+
+def invalidate_genre_cache():
+    with _lock:
+        _genre_ids.clear()
+
+
+def load_genre_cache():
+    """Fill the cache with every existing genre."""
+    rows = db.session.query(Genre.id, Genre.name).all()
+    with _lock:
+        _genre_ids.update({ row.name: row.id for row in rows })
+
+
+def _insert_missing(connection, names):
+    rows = [{ "name": name } for name in names]
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        connection.execute(insert(Genre.__table__).on_conflict_do_nothing(index_elements=['name']), rows)
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(Genre.__table__.insert().prefix_with('OR IGNORE'), rows)
+    else:
+        existing = { row.name for row in connection.execute(
+            db.select([Genre.name]).where(Genre.name.in_(names))) }
+        rows = [row for row in rows if row["name"] not in existing]
+        if rows:
+            connection.execute(Genre.__table__.insert(), rows)
+
+
+def _upsert(connection, names):
+    _insert_missing(connection, names)
+    return connection.execute(db.select([Genre.id, Genre.name]).where(Genre.name.in_(names))).fetchall()
+
+
+def genre_ids(names, connection=None, pending=None):
+    """Map each genre name to its id, creating the missing genres in one statement.
+
+    Missing genres are committed in their own transaction unless a connection
+    is given, in which case they are written inside the caller's transaction.
+    Their ids then go into `pending` rather than the cache, which the caller
+    fills with cache_genre_ids() once that transaction has committed.
+    """
+    names = list(dict.fromkeys(name.strip() for name in names if name and name.strip()))
+    pending = pending if pending is not None else {}
+    with _lock:
+        ids = { name: _genre_ids.get(name, pending.get(name)) for name in names }
+    missing = [name for name, genre_id in ids.items() if genre_id is None]
+    record_cache_lookup('genre', True, len(names) - len(missing))
+    record_cache_lookup('genre', False, len(missing))
+    if missing:
+        if connection is None:
+            # Own transaction, so genres stay valid for the cache even if the caller rolls back
+            with db.engine.begin() as own_connection:
+                found = { row.name: row.id for row in _upsert(own_connection, missing) }
+            cache_genre_ids(found)
+        else:
+            found = { row.name: row.id for row in _upsert(connection, missing) }
+            pending.update(found)
+        ids.update(found)
+    return ids
+
+
+def cache_genre_ids(ids):
+    """Add name -> id pairs from a committed transaction to the cache."""
+    with _lock:
+        _genre_ids.update(ids)
+
+
+def _detached_genre(genre_id, name):
+    genre = Genre(id=genre_id, name=name)
+    make_transient_to_detached(genre)
+    return genre
+
+
+def get_or_create_genres(names):
+    """Genre instances for the given names, attached to the current session without loading them."""
+    return [db.session.merge(_detached_genre(genre_id, name), load=False)
+            for name, genre_id in genre_ids(names).items()]
+
+
+@db.event.listens_for(Genre, 'after_update')
+@db.event.listens_for(Genre, 'after_delete')
+def _genre_changed(mapper, connection, target):
+    invalidate_genre_cache()
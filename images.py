@@ -0,0 +1,307 @@
+import hashlib
+import importlib.util
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+import click
+from flask import abort, send_from_directory
+from flask.cli import AppGroup
+
+from assets import IMMUTABLE
+from cache import page_cache
+from metrics import record_cache_lookup
+from models import *
+
+# ----------------------------------------------------------------------------#
+# Venue and artist images.
+#
+# Uploaded images, and images ingested once from a local path with
+# `flask images ingest`, are stored under IMAGE_STORE_DIR named by the
+# sha256 of their content, and the venue or artist links to them as
+# /images/<digest>.<ext>. image_url() gives templates a thumbnail of such a
+# link sized for its slot, /images/<size>/<digest>.<ext>, which is resized
+# from the original on its first request and kept in a cache directory
+# capped at IMAGE_CACHE_MAX_BYTES, least recently used first out. Every URL
+# names fixed content, so all of them are served immutable. Remote links
+# are left as they are. Thumbnails need Pillow; without it, templates link
+# the originals.
+# ----------------------------------------------------------------------------#
+
+URL_PREFIX = '/images/'
+# Slot -> bounding box in pixels, twice the CSS size for high-density screens
+SIZES = {
+    # .tile img: a third of the container wide, at most 200px high
+    'tile': (640, 400),
+    # The venue or artist page, half the container wide, at most 500px high
+    'detail': (1100, 1000),
+}
+# Accepted formats: leading bytes -> extension
+SIGNATURES = ((b'\xff\xd8\xff', 'jpg'), (b'\x89PNG\r\n\x1a\n', 'png'))
+SAVE_OPTIONS = {
+    'jpg': { 'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True },
+    'png': { 'format': 'PNG', 'optimize': True },
+    'webp': { 'format': 'WEBP', 'quality': 80 },
+}
+# A thumbnail's mtime is its last use; refreshed at most this often, in seconds
+TOUCH_INTERVAL = 60
+# Pruning stops below this share of the cap, so it does not run on every write
+PRUNE_TO = 0.9
+
+_NAME = re.compile(r'^[0-9a-f]{64}\.(jpg|png|webp)$')
+
+
+def sniff(data):
+    """The extension for an accepted image format, or None."""
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class ImageStore:
+    def __init__(self):
+        self.directory = None
+        self.max_upload_bytes = 10 * 1024 * 1024
+        self.max_bytes = 256 * 1024 * 1024
+        self.thumbnails = False
+        self.hits = self.misses = self.evictions = 0
+        # Bytes in the thumbnail cache as far as this process knows; other
+        # workers write there too, so each prune measures it again
+        self._size = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config.get('IMAGE_STORE_DIR') or os.path.join(app.instance_path, 'images')
+        self.max_upload_bytes = app.config.get('IMAGE_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+        self.max_bytes = app.config.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        self.thumbnails = importlib.util.find_spec('PIL') is not None
+        self._size = None
+        app.add_url_rule(f'{URL_PREFIX}<name>', 'image', self.serve_original)
+        app.add_url_rule(f'{URL_PREFIX}<size>/<name>', 'image_thumbnail', self.serve_thumbnail)
+        app.add_template_global(image_url)
+        app.cli.add_command(images_cli)
+
+    def original_path(self, name):
+        return os.path.join(self.directory, 'originals', name[:2], name)
+
+    def thumbnail_path(self, size, name):
+        return os.path.join(self.directory, 'thumbnails', size, name[:2], name)
+
+    def save(self, data):
+        """Store an image's bytes, unless an identical image is stored already, and return its link."""
+        extension = sniff(data)
+        if extension is None:
+            raise ValueError('Images must be JPEG, PNG or WebP files.')
+        if len(data) > self.max_upload_bytes:
+            raise ValueError(f'Images must be at most {self.max_upload_bytes} bytes.')
+        if self.thumbnails:
+            self._verify(data)
+        name = f'{hashlib.sha256(data).hexdigest()}.{extension}'
+        path = self.original_path(name)
+        if not os.path.exists(path):
+            _write(path, lambda destination: destination.write(data))
+        return URL_PREFIX + name
+
+    def save_upload(self, file):
+        """Store an uploaded file and return its link, or None when no file was sent."""
+        if not file or not file.filename:
+            return None
+        return self.save(file.read(self.max_upload_bytes + 1))
+
+    def _verify(self, data):
+        from io import BytesIO
+        from PIL import Image
+
+        try:
+            with Image.open(BytesIO(data)) as image:
+                image.verify()
+        except (Image.DecompressionBombError, OSError, SyntaxError) as e:
+            raise ValueError(f'Not a readable image: {e}')
+
+    def serve_original(self, name):
+        if not _NAME.match(name) or not os.path.isfile(self.original_path(name)):
+            abort(404)
+        return _immutable(send_from_directory(os.path.dirname(self.original_path(name)), name))
+
+    def serve_thumbnail(self, size, name):
+        if size not in SIZES or not _NAME.match(name) or not os.path.isfile(self.original_path(name)):
+            abort(404)
+        if not self.thumbnails:
+            return self.serve_original(name)
+        path = self.thumbnail_path(size, name)
+        try:
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self.misses += 1
+            record_cache_lookup('image', False)
+            self._render(self.original_path(name), SIZES[size], path)
+        else:
+            self.hits += 1
+            record_cache_lookup('image', True)
+            if time.time() - modified > TOUCH_INTERVAL:
+                os.utime(path)
+        return _immutable(send_from_directory(os.path.dirname(path), name))
+
+    def _render(self, source, box, path):
+        from PIL import Image, ImageOps
+
+        options = SAVE_OPTIONS[source.rsplit('.', 1)[1]]
+        with Image.open(source) as image:
+            if image.width <= box[0] and image.height <= box[1]:
+                # Already small enough; a re-encoded copy would only be worse
+                with open(source, 'rb') as original:
+                    _write(path, lambda destination: shutil.copyfileobj(original, destination))
+            else:
+                # JPEGs are decoded at the smallest scale that still covers the box
+                image.draft('RGB', box)
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail(box, Image.LANCZOS)
+                if options['format'] == 'JPEG' and image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                _write(path, lambda destination: image.save(destination, **options))
+        self._account(os.path.getsize(path))
+
+    def _account(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = self._measure()[0]
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self.prune()
+
+    def _measure(self):
+        entries = []
+        for directory, _, filenames in os.walk(os.path.join(self.directory, 'thumbnails')):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Pruned by another worker meanwhile
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sum(size for _, size, _ in entries), entries
+
+    def prune(self, max_bytes=None):
+        """Remove the least recently used thumbnails until the cache is under its cap; return how many."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        total, entries = self._measure()
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= limit * PRUNE_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._size = total
+        self.evictions += removed
+        return removed
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._size,
+            "thumbnails": self.thumbnails,
+        }
+
+
+image_store = ImageStore()
+
+
+def _write(path, write):
+    # Written aside and renamed into place, so no worker ever serves half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+    try:
+        with os.fdopen(descriptor, 'wb') as destination:
+            write(destination)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def _immutable(response):
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def image_url(link, size):
+    """The URL of a venue or artist image for a slot of the given size, for templates."""
+    if link and link.startswith(URL_PREFIX) and image_store.thumbnails:
+        name = link[len(URL_PREFIX):]
+        if _NAME.match(name):
+            return f'{URL_PREFIX}{size}/{name}'
+    return link
+
+
+images_cli = AppGroup('images', help='Venue and artist images.')
+
+_OWNER_FILE = re.compile(r'^(venue|artist)-(\d+)\.[^.]+$')
+
+
+def _link_image(kind, owner_id, link):
+    model = Venue if kind == 'venue' else Artist
+    owner = model.query.get(owner_id)
+    if owner is None:
+        raise click.ClickException(f'No {kind} with id {owner_id}.')
+    owner.image_link = link
+    db.session.commit()
+    page_cache.invalidate(f'{kind}s', 'shows', f'{kind}:{owner_id}')
+
+
+@images_cli.command('ingest')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--venue', 'venue_id', type=int, help='Use the image for this venue.')
+@click.option('--artist', 'artist_id', type=int, help='Use the image for this artist.')
+def ingest_command(path, venue_id, artist_id):
+    """Store a local image for a venue or artist, or a directory of venue-<id>.jpg and artist-<id>.png files."""
+    if os.path.isfile(path):
+        if (venue_id is None) == (artist_id is None):
+            raise click.UsageError('Give one of --venue or --artist for a single file.')
+        with open(path, 'rb') as source:
+            link = image_store.save(source.read())
+        if venue_id is not None:
+            _link_image('venue', venue_id, link)
+        else:
+            _link_image('artist', artist_id, link)
+        click.echo(link)
+        return
+
+    stored = skipped = 0
+    for filename in sorted(os.listdir(path)):
+        match = _OWNER_FILE.match(filename)
+        if not match:
+            continue
+        try:
+            with open(os.path.join(path, filename), 'rb') as source:
+                link = image_store.save(source.read())
+            _link_image(match.group(1), int(match.group(2)), link)
+            stored += 1
+        except (ValueError, click.ClickException) as e:
+            click.echo(f'{filename}: {getattr(e, "message", e)}', err=True)
+            skipped += 1
+    click.echo(f'Stored {stored} images and skipped {skipped}.')
+
+
+@images_cli.command('prune')
+@click.option('--max-bytes', type=int, default=None, help='Cap to prune to (default: IMAGE_CACHE_MAX_BYTES).')
+def prune_command(max_bytes):
+    """Remove the least recently used thumbnails until the cache is under its cap."""
+    removed = image_store.prune(max_bytes)
+    click.echo(f'Removed {removed} thumbnails; {image_store.stats()["size_bytes"]} bytes remain.')
@@ -0,0 +1,415 @@
+import csv
+import io
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+import dateutil.parser
+
+from genres import cache_genre_ids, genre_ids
+from models import *
+from search import FTS_TABLES, search_text_for
+
+# ----------------------------------------------------------------------------#
+# Bulk import.
+#
+# Records are streamed from CSV or NDJSON through generators, cleaned, and
+# written in batches with executemany (COPY on PostgreSQL). Memory depends on
+# the batch size and the size of the venue/artist lookup maps, never on the
+# size of the input file. After every commit the number of records consumed
+# is written to a checkpoint file so an interrupted import can resume, and
+# rejected records are appended to a rejects file with the reason.
+#
+# Venues and artists get new ids. With an id map file, the ids they had in
+# the file (an export of another database) are recorded against the new
+# ones, and show imports resolve venue_id and artist_id through it.
+# ----------------------------------------------------------------------------#
+
+IMPORT_KINDS = ('genres', 'venues', 'artists', 'shows')
+TRUE_VALUES = { 'true', 't', 'yes', 'y', '1', 'on' }
+
+
+class RejectedRecord(ValueError):
+    pass
+
+
+#  Reading
+#  ----------------------------------------------------------------
+
+def read_records(path, fmt=None):
+    """Yield each record of a CSV or NDJSON file as a dict."""
+    fmt = fmt or ('ndjson' if path.endswith(('.ndjson', '.jsonl', '.json')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as source:
+        if fmt == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(records, size):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+#  Cleaning
+#  ----------------------------------------------------------------
+
+def _text(record, field, required=False, max_length=None):
+    value = record.get(field)
+    value = value.strip() if isinstance(value, str) else value
+    if required and not value:
+        raise RejectedRecord(f"missing '{field}'")
+    if value and max_length and len(value) > max_length:
+        raise RejectedRecord(f"'{field}' is longer than {max_length} characters")
+    return value or None
+
+
+def _flag(record, field):
+    value = record.get(field)
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def _genre_names(record):
+    value = record.get('genres') or []
+    if isinstance(value, str):
+        value = value.replace(',', ';').split(';')
+    names = [name.strip() for name in value if name and name.strip()]
+    for name in names:
+        if len(name) > 65:
+            raise RejectedRecord(f"genre '{name[:65]}...' is longer than 65 characters")
+    return names
+
+
+def clean_genre(record, resolver):
+    return { "name": _text(record, 'name', required=True, max_length=65) }
+
+
+def _clean_owner(record, owner_fields):
+    row = {
+        "name": _text(record, 'name', required=True),
+        "city": _text(record, 'city', required=True, max_length=120),
+        "state": _text(record, 'state', required=True, max_length=120),
+        "phone": _text(record, 'phone', required=True, max_length=120),
+        "image_link": _text(record, 'image_link', max_length=500),
+        "facebook_link": _text(record, 'facebook_link', max_length=120),
+        "website": _text(record, 'website', max_length=150),
+        "seeking_description": _text(record, 'seeking_description', max_length=250),
+        "genres": _genre_names(record),
+        # The record's id in the file, for the id map; never written to the table
+        "source_id": _text(record, 'id'),
+    }
+    row.update(owner_fields)
+    return row
+
+
+def clean_venue(record, resolver):
+    return _clean_owner(record, {
+        "address": _text(record, 'address', required=True, max_length=120),
+        "seeking_talent": _flag(record, 'seeking_talent'),
+    })
+
+
+def clean_artist(record, resolver):
+    return _clean_owner(record, { "seeking_venue": _flag(record, 'seeking_venue') })
+
+
+def clean_show(record, resolver):
+    try:
+        start_time = dateutil.parser.parse(str(record.get('start_time') or ''))
+    except (ValueError, OverflowError):
+        raise RejectedRecord(f"invalid start_time '{record.get('start_time')}'")
+    return {
+        "venue_id": resolver.resolve(Venue, record.get('venue_id'), record.get('venue_name')),
+        "artist_id": resolver.resolve(Artist, record.get('artist_id'), record.get('artist_name')),
+        "start_time": start_time,
+    }
+
+
+# Id map section of each owner model
+ID_MAP_KINDS = { Venue: 'venues', Artist: 'artists' }
+
+
+class ForeignKeyResolver:
+    """In-memory id -> name and name -> id maps for venues and artists, loaded on first use.
+
+    `id_map` maps the ids venues and artists had in their import files to the
+    ids they were given, per kind ('venues' or 'artists'), as strings.
+
+    It also holds what the current transaction has added: the genres it
+    created and its id map entries, which committed() hands over once the
+    transaction is safely in.
+    """
+
+    def __init__(self, connection, id_map=None):
+        self.connection = connection
+        self.id_map = id_map if id_map is not None else {}
+        self.ids = {}
+        self.names = {}
+        self.genres = {}
+        self.new_ids = {}
+
+    def _load(self, model):
+        ids, names = {}, {}
+        for row in self.connection.execute(db.select([model.id, model.name])):
+            ids[row.id] = row.name
+            names.setdefault(row.name.lower(), row.id)
+        self.ids[model], self.names[model] = ids, names
+
+    def _by_name(self, model, name):
+        if name and name.strip().lower() in self.names[model]:
+            return self.names[model][name.strip().lower()]
+        return None
+
+    def resolve(self, model, entity_id, name):
+        if model not in self.ids:
+            self._load(model)
+        label = model.__name__.lower()
+        if entity_id not in (None, ''):
+            entity_id = str(entity_id).strip()
+            mapped = self.id_map.get(ID_MAP_KINDS[model])
+            if mapped:
+                # The file's ids are those of an imported export, not ours
+                if entity_id in mapped:
+                    return mapped[entity_id]
+                by_name = self._by_name(model, name)
+                if by_name is None:
+                    raise RejectedRecord(f"{label}_id {entity_id} is not in the id map")
+                return by_name
+            try:
+                entity_id = int(entity_id)
+            except ValueError:
+                raise RejectedRecord(f"invalid {label}_id '{entity_id}'")
+            if entity_id not in self.ids[model]:
+                raise RejectedRecord(f"unknown {label}_id {entity_id}")
+            # An id from another database may well exist here too, as someone else
+            if name and name.strip().lower() != self.ids[model][entity_id].lower():
+                raise RejectedRecord(f"{label}_id {entity_id} is '{self.ids[model][entity_id]}', not '{name.strip()}'")
+            return entity_id
+        by_name = self._by_name(model, name)
+        if by_name is None:
+            raise RejectedRecord(f"unknown {label} '{name}'" if name else f"missing {label}_id or {label}_name")
+        return by_name
+
+    def add(self, model, entity_id, name, source_id=None):
+        if model in self.ids:
+            self.ids[model][entity_id] = name
+            self.names[model].setdefault(name.lower(), entity_id)
+        if source_id is not None:
+            self.id_map.setdefault(ID_MAP_KINDS[model], {})[source_id] = entity_id
+            self.new_ids.setdefault(ID_MAP_KINDS[model], {})[source_id] = entity_id
+
+    def committed(self):
+        """Cache the genres the committed transaction created and return the id map entries it added."""
+        cache_genre_ids(self.genres)
+        new_ids, self.genres, self.new_ids = self.new_ids, {}, {}
+        return new_ids
+
+
+#  Writing
+#  ----------------------------------------------------------------
+
+def _copy(connection, table, rows):
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')', buffer)
+
+
+def insert_rows(connection, table, rows, use_copy=True):
+    if not rows:
+        return
+    if use_copy and connection.dialect.name == 'postgresql':
+        _copy(connection, table, rows)
+    else:
+        connection.execute(table.insert(), rows)
+
+
+def allocate_ids(connection, model, count):
+    """Reserve `count` primary keys so association rows can be written without RETURNING."""
+    if connection.dialect.name == 'postgresql':
+        return [row[0] for row in connection.execute(db.text(
+            f"SELECT nextval(pg_get_serial_sequence('\"{model.__tablename__}\"', 'id')) "
+            f"FROM generate_series(1, :count)"), count=count)]
+    # SQLite has a single writer, so max(id) is stable inside the write transaction
+    start = connection.execute(db.select([db.func.coalesce(db.func.max(model.id), 0)])).scalar() + 1
+    return list(range(start, start + count))
+
+
+def write_genres(connection, rows, resolver, use_copy):
+    genre_ids((row["name"] for row in rows), connection=connection, pending=resolver.genres)
+
+
+def _write_owners(connection, model, association, foreign_key, rows, resolver, use_copy):
+    ids = genre_ids((name for row in rows for name in row["genres"]), connection=connection,
+                    pending=resolver.genres)
+    owner_ids = allocate_ids(connection, model, len(rows))
+
+    owners, links = [], []
+    for owner_id, row in zip(owner_ids, rows):
+        genres = row.pop("genres")
+        source_id = row.pop("source_id", None)
+        row.update(id=owner_id, search_text=search_text_for(row["city"], row["state"], genres),
+                   upcoming_shows_count=0, past_shows_count=0, updated_at=datetime.utcnow())
+        owners.append(row)
+        links.extend({ "genre_id": ids[name], foreign_key: owner_id } for name in dict.fromkeys(genres))
+        resolver.add(model, owner_id, row["name"], source_id)
+
+    insert_rows(connection, model.__table__, owners, use_copy)
+    insert_rows(connection, association, links, use_copy)
+    if connection.dialect.name == 'sqlite':
+        connection.execute(db.text(
+            f'INSERT INTO {FTS_TABLES[model]} (rowid, name, details) VALUES (:id, :name, :search_text)'
+        ), [{ "id": row["id"], "name": row["name"], "search_text": row["search_text"] } for row in owners])
+
+
+def write_venues(connection, rows, resolver, use_copy):
+    _write_owners(connection, Venue, venue_genre, 'venue_id', rows, resolver, use_copy)
+
+
+def write_artists(connection, rows, resolver, use_copy):
+    _write_owners(connection, Artist, artist_genre, 'artist_id', rows, resolver, use_copy)
+
+
+def write_shows(connection, rows, resolver, use_copy):
+    now = datetime.now()
+    for row in rows:
+        row["upcoming"] = row["start_time"] > now
+    insert_rows(connection, Show.__table__, rows, use_copy)
+
+    # Same bookkeeping the Show insert events do, aggregated per owner
+    for model, foreign_key in (Venue, 'venue_id'), (Artist, 'artist_id'):
+        deltas = Counter((row[foreign_key], row["upcoming"]) for row in rows)
+        for upcoming in (True, False):
+            counter = 'upcoming_shows_count' if upcoming else 'past_shows_count'
+            params = [{ "owner_id": owner_id, "delta": delta }
+                      for (owner_id, is_upcoming), delta in deltas.items() if is_upcoming == upcoming]
+            if params:
+                connection.execute(
+                    model.__table__.update()
+                    .where(model.id == db.bindparam('owner_id'))
+                    .values({ counter: getattr(model, counter) + db.bindparam('delta'),
+                              'updated_at': datetime.utcnow() }),
+                    params
+                )
+
+
+CLEANERS = { 'genres': clean_genre, 'venues': clean_venue, 'artists': clean_artist, 'shows': clean_show }
+WRITERS = { 'genres': write_genres, 'venues': write_venues, 'artists': write_artists, 'shows': write_shows }
+
+
+#  Pipeline
+#  ----------------------------------------------------------------
+
+def _read_checkpoint(checkpoint_path, path, kind):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path) as checkpoint:
+        state = json.load(checkpoint)
+    if state.get('path') != os.path.abspath(path) or state.get('kind') != kind:
+        return 0
+    return state['records']
+
+
+def _read_id_map(id_map_path):
+    """Replay the id map file, one JSON object of new entries per committed chunk."""
+    id_map = {}
+    if not id_map_path or not os.path.exists(id_map_path):
+        return id_map
+    with open(id_map_path) as lines:
+        for line in lines:
+            try:
+                entries = json.loads(line)
+            except ValueError:
+                # A line torn by a crash; its chunk was never checkpointed
+                continue
+            for kind, ids in entries.items():
+                id_map.setdefault(kind, {}).update(ids)
+    return id_map
+
+
+def _append_id_map(id_map_path, new_ids):
+    if not id_map_path or not new_ids:
+        return
+    with open(id_map_path, 'a') as destination:
+        destination.write(json.dumps(new_ids) + '\n')
+
+
+def _write_checkpoint(checkpoint_path, path, kind, records):
+    if not checkpoint_path:
+        return
+    temporary = f'{checkpoint_path}.tmp'
+    with open(temporary, 'w') as checkpoint:
+        json.dump({ "path": os.path.abspath(path), "kind": kind, "records": records }, checkpoint)
+    os.replace(temporary, checkpoint_path)
+
+
+def import_file(kind, path, fmt=None, batch_size=1000, commit_every=10, checkpoint_path=None,
+                rejects_path=None, id_map_path=None, use_copy=True, report=print):
+    """Stream `path` into the `kind` table. Returns (imported, rejected, seconds).
+
+    Venue and artist imports add their records' ids to the id map at
+    `id_map_path`; show imports resolve venue_id and artist_id through it.
+    """
+    clean, write = CLEANERS[kind], WRITERS[kind]
+    resume_at = _read_checkpoint(checkpoint_path, path, kind)
+    records = enumerate(read_records(path, fmt), start=1)
+    if resume_at:
+        records = islice(records, resume_at, None)
+        report(f'Resuming after record {resume_at}.')
+
+    imported = rejected = 0
+    position = resume_at
+    started = time.perf_counter()
+    rejects = open(rejects_path, 'a') if rejects_path else None
+    connection = db.engine.connect()
+    resolver = ForeignKeyResolver(connection, _read_id_map(id_map_path))
+    try:
+        for chunk in batched(records, batch_size * commit_every):
+            pending_rejects = []
+            with connection.begin():
+                for batch in batched(chunk, batch_size):
+                    rows = []
+                    for number, record in batch:
+                        try:
+                            rows.append(clean(record, resolver))
+                        except RejectedRecord as e:
+                            pending_rejects.append({ "record": number, "error": str(e), "data": record })
+                    write(connection, rows, resolver, use_copy)
+                    imported += len(rows)
+
+            position = chunk[-1][0]
+            # Before the checkpoint, so a resumed import never misses an id
+            _append_id_map(id_map_path, resolver.committed())
+            rejected += len(pending_rejects)
+            if rejects:
+                for reject in pending_rejects:
+                    rejects.write(json.dumps(reject, default=str) + '\n')
+                rejects.flush()
+            _write_checkpoint(checkpoint_path, path, kind, position)
+
+            elapsed = time.perf_counter() - started
+            report(f'{imported} {kind} imported, {rejected} rejected '
+                   f'({(imported + rejected) / elapsed:.0f} rows/sec)')
+    finally:
+        connection.close()
+        if rejects:
+            rejects.close()
+
+    return imported, rejected, time.perf_counter() - started
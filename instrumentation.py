@@ -0,0 +1,112 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ----------------------------------------------------------------------------#
+# SQL instrumentation.
+#
+# Cursor events on every engine (primary and replicas) record the number of
+# queries, total database time and slowest statement of each request. The
+# totals go out as a Server-Timing header and a log line. When one statement
+# shape runs more than SQL_REPEAT_THRESHOLD times in a request, a warning is
+# logged, since that is usually a query issued once per row (N+1).
+# query_budget() asserts the same counts around a block of requests;
+# benchmarks/routes.py holds the N+1-prone routes to fixed budgets with it.
+# ----------------------------------------------------------------------------#
+
+_local = threading.local()
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|:\w+)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """The statement with whitespace and expanded IN lists collapsed, so repeats compare equal."""
+    return _IN_LIST.sub('(?)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = (0.0, None)
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        if duration >= self.slowest[0]:
+            self.slowest = (duration, statement)
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+def _active_stats():
+    stats = list(getattr(_local, 'budgets', ()))
+    if has_app_context():
+        stats.append(g.setdefault('query_stats', QueryStats()))
+    return stats
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - connection.info['query_started'].pop()
+    for stats in _active_stats():
+        stats.record(statement, duration)
+
+
+@contextmanager
+def query_budget(limit):
+    """Fail if the block runs more than `limit` queries.
+
+        with query_budget(3):
+            client.get('/venues/1')
+    """
+    stats = QueryStats()
+    budgets = _local.__dict__.setdefault('budgets', [])
+    budgets.append(stats)
+    try:
+        yield stats
+    finally:
+        budgets.remove(stats)
+    if stats.count > limit:
+        repeats = ''.join(f'\n  {count}x {shape[:200]}' for shape, count in stats.shapes.most_common(5))
+        raise AssertionError(f'{stats.count} queries run, budget is {limit}:{repeats}')
+
+
+def init_sql_instrumentation(app):
+    @app.before_request
+    def reset_query_stats():
+        # Queries from before_first_request hooks are not this request's
+        g.query_stats = QueryStats()
+
+    @app.after_request
+    def report_query_stats(response):
+        if not app.config.get('SQL_INSTRUMENTATION', True):
+            return response
+        stats = g.get('query_stats')
+        if stats is None or not stats.count:
+            return response
+
+        slowest, statement = stats.slowest
+        response.headers.add('Server-Timing', f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"')
+        response.headers.add('Server-Timing', f'db-slowest;dur={slowest * 1000:.2f}')
+        app.logger.debug(f'{request.method} {request.full_path} {response.status_code}: {stats.count} queries, '
+                         f'{stats.duration * 1000:.1f}ms in the database, slowest {slowest * 1000:.1f}ms: '
+                         f'{statement_shape(statement)[:200]}')
+
+        for shape, count in stats.repeated(app.config.get('SQL_REPEAT_THRESHOLD', 5)):
+            app.logger.warning(f'Possible N+1 in {request.endpoint}: {count} runs of {shape[:200]}')
+        return response
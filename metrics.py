@@ -0,0 +1,105 @@
+import os
+import time
+
+from flask import Response, g, request
+from jinja2 import Template
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+from models import db
+from replicas import replica_set
+
+# ----------------------------------------------------------------------------#
+# Metrics.
+#
+# Prometheus metrics served from /metrics. Under gunicorn, set
+# prometheus_multiproc_dir to an empty directory shared by the workers: every
+# process then writes its samples to memory-mapped files there and /metrics
+# aggregates them, so any worker can answer a scrape. Gauges use the
+# "livesum" mode, which sums over the workers that are still alive.
+# ----------------------------------------------------------------------------#
+
+REQUEST_LATENCY = Histogram('fyyur_request_duration_seconds', 'Time spent handling requests',
+                            ['endpoint', 'method', 'status'])
+REQUESTS_IN_PROGRESS = Gauge('fyyur_requests_in_progress', 'Requests being handled',
+                             multiprocess_mode='livesum')
+TEMPLATE_RENDER = Histogram('fyyur_template_render_seconds', 'Time spent rendering templates', ['template'])
+CACHE_LOOKUPS = Counter('fyyur_cache_lookups_total', 'Cache lookups by cache and result (hit or miss)',
+                        ['cache', 'result'])
+CREATED = Counter('fyyur_created_total', 'Venues, artists and shows created through the site', ['kind'])
+POOL_SIZE = Gauge('fyyur_db_pool_size', 'Configured connection pool size', ['bind'],
+                  multiprocess_mode='livesum')
+POOL_CHECKED_OUT = Gauge('fyyur_db_pool_checked_out', 'Connections checked out of the pool', ['bind'],
+                         multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('fyyur_db_pool_overflow', 'Connections open beyond the pool size', ['bind'],
+                      multiprocess_mode='livesum')
+
+
+def record_cache_lookup(cache, hit, count=1):
+    if count:
+        CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc(count)
+
+
+def record_created(kind):
+    CREATED.labels(kind).inc()
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            TEMPLATE_RENDER.labels(self.name or 'string').observe(time.perf_counter() - started)
+
+
+def _update_pool_gauges():
+    binds = [('primary', db.engine)] + [(f'replica{number}', replica.engine)
+                                        for number, replica in enumerate(replica_set.replicas)]
+    for bind, engine in binds:
+        pool = engine.pool
+        # Only queue pools keep these numbers; SQLite files use a pool per connection
+        if hasattr(pool, 'checkedout'):
+            POOL_SIZE.labels(bind).set(pool.size())
+            POOL_CHECKED_OUT.labels(bind).set(pool.checkedout())
+            POOL_OVERFLOW.labels(bind).set(max(pool.overflow(), 0))
+
+
+def mark_worker_dead(pid):
+    """Drop a dead worker's live gauges; call from gunicorn's child_exit hook."""
+    if 'prometheus_multiproc_dir' in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def init_metrics(app):
+    app.jinja_env.template_class = TimedTemplate
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.get('request_started')
+        if started is not None:
+            # Unrouted paths share one label so random URLs cannot grow the series
+            REQUEST_LATENCY.labels(request.endpoint or 'unmatched', request.method, response.status_code) \
+                .observe(time.perf_counter() - started)
+        _update_pool_gauges()
+        return response
+
+    @app.teardown_request
+    def finish_request(exception=None):
+        if g.pop('request_started', None) is not None:
+            REQUESTS_IN_PROGRESS.dec()
+
+    @app.route('/metrics')
+    def metrics():
+        _update_pool_gauges()
+        if 'prometheus_multiproc_dir' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), headers={ "Content-Type": CONTENT_TYPE_LATEST })
@@ -0,0 +1,43 @@
+"""unique Genre.name
+
+Revision ID: 2f6a8c3d1e90
+Revises: 9e3c51f0a8b2
+Create Date: 2026-10-17 13:05:52.640117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f6a8c3d1e90'
+down_revision = '9e3c51f0a8b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fold duplicate genre names into the oldest row before adding the constraint
+    connection = op.get_bind()
+    duplicates = connection.execute(
+        'SELECT g.id, (SELECT min(k.id) FROM "Genre" k WHERE k.name = g.name) AS keep_id '
+        'FROM "Genre" g WHERE g.id > (SELECT min(k.id) FROM "Genre" k WHERE k.name = g.name)'
+    ).fetchall()
+    for duplicate_id, keep_id in duplicates:
+        for association, foreign_key in (('artist_genre', 'artist_id'), ('venue_genre', 'venue_id')):
+            connection.execute(sa.text(
+                f'DELETE FROM {association} WHERE genre_id = :duplicate AND {foreign_key} IN '
+                f'(SELECT {foreign_key} FROM {association} WHERE genre_id = :keep)'
+            ), duplicate=duplicate_id, keep=keep_id)
+            connection.execute(sa.text(
+                f'UPDATE {association} SET genre_id = :keep WHERE genre_id = :duplicate'
+            ), duplicate=duplicate_id, keep=keep_id)
+        connection.execute(sa.text('DELETE FROM "Genre" WHERE id = :duplicate'), duplicate=duplicate_id)
+
+    with op.batch_alter_table('Genre') as batch_op:
+        batch_op.create_unique_constraint('Genre_name_key', ['name'])
+
+
+def downgrade():
+    with op.batch_alter_table('Genre') as batch_op:
+        batch_op.drop_constraint('Genre_name_key', type_='unique')
@@ -0,0 +1,46 @@
+"""(name, id) indexes for the venue and artist directories
+
+Revision ID: 3c9d2b7e4f18
+Revises: 8a4e6c2f1b37
+Create Date: 2026-10-17 18:42:10.504117
+
+"""
+from contextlib import nullcontext
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d2b7e4f18'
+down_revision = '8a4e6c2f1b37'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_Venue_name_id', 'Venue', ['name', 'id']),
+    ('ix_Venue_state_name_id', 'Venue', ['state', 'name', 'id']),
+    ('ix_Artist_name_id', 'Artist', ['name', 'id']),
+    ('ix_Artist_state_name_id', 'Artist', ['state', 'name', 'id']),
+)
+
+
+def _concurrently():
+    # See 8a4e6c2f1b37: concurrent index builds cannot run inside a transaction
+    if op.get_bind().dialect.name == 'postgresql':
+        return op.get_context().autocommit_block(), { 'postgresql_concurrently': True }
+    return nullcontext(), {}
+
+
+def upgrade():
+    block, options = _concurrently()
+    with block:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, **options)
+
+
+def downgrade():
+    block, options = _concurrently()
+    with block:
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, **options)
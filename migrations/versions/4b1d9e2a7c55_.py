@@ -0,0 +1,53 @@
+"""show counters on Venue and Artist
+
+Revision ID: 4b1d9e2a7c55
+Revises: c7fe02b4a4d7
+Create Date: 2026-10-17 10:12:41.208351
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1d9e2a7c55'
+down_revision = 'c7fe02b4a4d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Venue', sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_Venue_upcoming_shows_count'), 'Venue', ['upcoming_shows_count'], unique=False)
+    op.add_column('Artist', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artist', sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_Artist_upcoming_shows_count'), 'Artist', ['upcoming_shows_count'], unique=False)
+    op.add_column('Show', sa.Column('upcoming', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_index(op.f('ix_Show_upcoming'), 'Show', ['upcoming'], unique=False)
+
+    # Backfill the counters for existing shows
+    op.execute(sa.text('UPDATE "Show" SET upcoming = (start_time > :now)').bindparams(now=datetime.now()))
+    for table, foreign_key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute(
+            f'UPDATE "{table}" SET '
+            f'upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{foreign_key} = "{table}".id AND "Show".upcoming), '
+            f'past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{foreign_key} = "{table}".id AND NOT "Show".upcoming)'
+        )
+
+
+def downgrade():
+    # SQLite cannot drop columns in place; batch mode copies the table instead
+    op.drop_index(op.f('ix_Show_upcoming'), table_name='Show')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('upcoming')
+    op.drop_index(op.f('ix_Artist_upcoming_shows_count'), table_name='Artist')
+    with op.batch_alter_table('Artist') as batch_op:
+        batch_op.drop_column('past_shows_count')
+        batch_op.drop_column('upcoming_shows_count')
+    op.drop_index(op.f('ix_Venue_upcoming_shows_count'), table_name='Venue')
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_column('past_shows_count')
+        batch_op.drop_column('upcoming_shows_count')
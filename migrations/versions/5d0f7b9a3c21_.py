@@ -0,0 +1,41 @@
+"""updated_at on Venue and Artist
+
+Revision ID: 5d0f7b9a3c21
+Revises: 2f6a8c3d1e90
+Create Date: 2026-10-17 14:22:18.093615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0f7b9a3c21'
+down_revision = '2f6a8c3d1e90'
+branch_labels = None
+depends_on = None
+
+
+def _utc_now():
+    # The app writes datetime.utcnow(); now() would be the server's local time
+    # once stored without a time zone
+    if op.get_bind().dialect.name == 'postgresql':
+        return sa.text("(now() at time zone 'utc')")
+    return sa.text('CURRENT_TIMESTAMP')
+
+
+def upgrade():
+    # SQLite only adds a column with a non-constant default to a table with
+    # rows by copying the table
+    recreate = 'always' if op.get_bind().dialect.name == 'sqlite' else 'auto'
+    for table in ('Venue', 'Artist'):
+        with op.batch_alter_table(table, recreate=recreate) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=_utc_now(), nullable=False))
+        op.create_index(op.f(f'ix_{table}_updated_at'), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,54 @@
+"""case-insensitive (lower(name), id) indexes for the venue and artist directories
+
+Revision ID: 6f1b8d3e5a27
+Revises: 3c9d2b7e4f18
+Create Date: 2026-10-17 19:05:37.218640
+
+"""
+from contextlib import nullcontext
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f1b8d3e5a27'
+down_revision = '3c9d2b7e4f18'
+branch_labels = None
+depends_on = None
+
+# table, (old index, columns) from 3c9d2b7e4f18, (new index, columns)
+INDEXES = (
+    ('Venue', ('ix_Venue_name_id', ['name', 'id']), ('ix_Venue_lower_name_id', ['lower(name)', 'id'])),
+    ('Venue', ('ix_Venue_state_name_id', ['state', 'name', 'id']),
+     ('ix_Venue_state_lower_name_id', ['state', 'lower(name)', 'id'])),
+    ('Artist', ('ix_Artist_name_id', ['name', 'id']), ('ix_Artist_lower_name_id', ['lower(name)', 'id'])),
+    ('Artist', ('ix_Artist_state_name_id', ['state', 'name', 'id']),
+     ('ix_Artist_state_lower_name_id', ['state', 'lower(name)', 'id'])),
+)
+
+
+def _concurrently():
+    # See 8a4e6c2f1b37: concurrent index builds cannot run inside a transaction
+    if op.get_bind().dialect.name == 'postgresql':
+        return op.get_context().autocommit_block(), { 'postgresql_concurrently': True }
+    return nullcontext(), {}
+
+
+def _replace(table, old, new):
+    block, options = _concurrently()
+    name, columns = new
+    with block:
+        op.create_index(name, table, [sa.text(column) if '(' in column else column for column in columns],
+                        unique=False, **options)
+        op.drop_index(old[0], table_name=table, **options)
+
+
+def upgrade():
+    for table, old, new in INDEXES:
+        _replace(table, old, new)
+
+
+def downgrade():
+    for table, old, new in reversed(INDEXES):
+        _replace(table, new, old)
@@ -0,0 +1,56 @@
+"""performance indexes for Show, Venue and the genre association tables
+
+Revision ID: 8a4e6c2f1b37
+Revises: 5d0f7b9a3c21
+Create Date: 2026-10-17 16:05:41.278314
+
+"""
+from contextlib import nullcontext
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6c2f1b37'
+down_revision = '5d0f7b9a3c21'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time']),
+    ('ix_Show_start_time_id', 'Show', ['start_time', 'id']),
+    ('ix_Show_upcoming_start_time', 'Show', ['upcoming', 'start_time']),
+    ('ix_Venue_state_city_name', 'Venue', ['state', 'city', 'name', 'id']),
+    ('ix_artist_genre_artist_id', 'artist_genre', ['artist_id']),
+    ('ix_venue_genre_venue_id', 'venue_genre', ['venue_id']),
+)
+# Covered by ix_Show_upcoming_start_time
+REPLACED = (('ix_Show_upcoming', 'Show', ['upcoming']),)
+
+
+def _concurrently():
+    # CREATE/DROP INDEX CONCURRENTLY keeps the tables writable while the index
+    # builds, but cannot run inside a transaction
+    if op.get_bind().dialect.name == 'postgresql':
+        return op.get_context().autocommit_block(), { 'postgresql_concurrently': True }
+    return nullcontext(), {}
+
+
+def upgrade():
+    block, options = _concurrently()
+    with block:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, **options)
+        for name, table, _ in REPLACED:
+            op.drop_index(name, table_name=table, **options)
+
+
+def downgrade():
+    block, options = _concurrently()
+    with block:
+        for name, table, columns in REPLACED:
+            op.create_index(name, table, columns, unique=False, **options)
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, **options)
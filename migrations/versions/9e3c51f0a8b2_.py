@@ -0,0 +1,65 @@
+"""full-text search index for Venue and Artist
+
+Revision ID: 9e3c51f0a8b2
+Revises: 4b1d9e2a7c55
+Create Date: 2026-10-17 11:40:03.517902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3c51f0a8b2'
+down_revision = '4b1d9e2a7c55'
+branch_labels = None
+depends_on = None
+
+SEARCHABLE = (('Venue', 'venue_genre', 'venue_id', 'venue_search'),
+              ('Artist', 'artist_genre', 'artist_id', 'artist_search'))
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    aggregate = 'string_agg' if dialect == 'postgresql' else 'group_concat'
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    for table, genre_table, foreign_key, fts_table in SEARCHABLE:
+        op.add_column(table, sa.Column('search_text', sa.Text(), server_default='', nullable=False))
+
+        # Backfill "city state genres" for existing rows in one statement, as
+        # search.search_text_for() writes it
+        op.execute(
+            f'UPDATE "{table}" SET search_text = '
+            f"coalesce(city, '') || ' ' || coalesce(state, '') || coalesce(("
+            f"SELECT ' ' || {aggregate}(\"Genre\".name, ' ') FROM {genre_table} "
+            f'JOIN "Genre" ON "Genre".id = {genre_table}.genre_id '
+            f'WHERE {genre_table}.{foreign_key} = "{table}".id), \'\')'
+        )
+
+        if dialect == 'postgresql':
+            op.execute(
+                f'CREATE INDEX "ix_{table}_search_vector" ON "{table}" USING gin ('
+                f"(setweight(to_tsvector('simple'::regconfig, name), 'A') || "
+                f"setweight(to_tsvector('simple'::regconfig, search_text), 'B')))"
+            )
+            op.execute(f'CREATE INDEX "ix_{table}_name_trgm" ON "{table}" USING gin (name gin_trgm_ops)')
+            op.execute(f'CREATE INDEX "ix_{table}_search_text_trgm" ON "{table}" USING gin (search_text gin_trgm_ops)')
+        elif dialect == 'sqlite':
+            op.execute(f'CREATE VIRTUAL TABLE {fts_table} USING fts5(name, details)')
+            op.execute(f'INSERT INTO {fts_table} (rowid, name, details) SELECT id, name, search_text FROM "{table}"')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table, _, _, fts_table in SEARCHABLE:
+        if dialect == 'postgresql':
+            op.drop_index(f'ix_{table}_search_text_trgm', table_name=table)
+            op.drop_index(f'ix_{table}_name_trgm', table_name=table)
+            op.drop_index(f'ix_{table}_search_vector', table_name=table)
+        elif dialect == 'sqlite':
+            op.execute(f'DROP TABLE IF EXISTS {fts_table}')
+        # SQLite cannot drop columns in place; batch mode copies the table instead
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('search_text')
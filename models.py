@@ -1,6 +1,29 @@
-from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime
 
-db = SQLAlchemy()
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from replicas import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
+
+
+class utc_now(FunctionElement):
+    """The current UTC time without a time zone, as datetime.utcnow() gives it, for server defaults."""
+    type = db.DateTime()
+    name = 'utc_now'
+
+
+@compiles(utc_now)
+def _compile_utc_now(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is UTC
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(utc_now, 'postgresql')
+def _compile_utc_now_postgresql(element, compiler, **kw):
+    # now() would be the server's local time once stored without a time zone
+    return "(now() at time zone 'utc')"
 
 # ----------------------------------------------------------------------------#
 # Models.
@@ -10,22 +33,29 @@ class Genre(db.Model):
     __tablename__ = 'Genre'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(65), nullable=False)
+    name = db.Column(db.String(65), nullable=False, unique=True)
 
 artist_genre = db.Table('artist_genre',
     db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
-    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
+    # The primary key leads with genre_id; this serves the artist -> genres direction
+    db.Index('ix_artist_genre_artist_id', 'artist_id')
 )
 
 venue_genre = db.Table('venue_genre',
     db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
-    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
+    db.Index('ix_venue_genre_venue_id', 'venue_id')
 )
 
 
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # The directory within a city
+        db.Index('ix_Venue_state_city_name', 'state', 'city', 'name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -40,13 +70,23 @@ class Venue(db.Model):
     shows = db.relationship('Show', backref='venue', lazy=True) 
     seeking_talent = db.Column(db.Boolean, nullable=True, default=False)
     seeking_description = db.Column(db.String(250), nullable=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # City, state and genre names for full-text search (see search.py)
+    search_text = db.Column(db.Text, nullable=False, default='', server_default='')
+    # Bumped on every change to the row or its show counters; drives API ETags
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=utc_now(), index=True)
 
     def __repr__(self):
         return f'<Venue {self.id} {self.name}>'
 
+# The directory pages on (lower(name), id), optionally within a state
+db.Index('ix_Venue_lower_name_id', db.func.lower(Venue.name), Venue.id)
+db.Index('ix_Venue_state_lower_name_id', Venue.state, db.func.lower(Venue.name), Venue.id)
+
 class Artist(db.Model):
     __tablename__ = 'Artist'
-
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
@@ -59,17 +99,37 @@ class Artist(db.Model):
     website = db.Column(db.String(150), nullable=True)
     seeking_venue = db.Column(db.Boolean, nullable=True, default=False)
     seeking_description = db.Column(db.String(250), nullable=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # City, state and genre names for full-text search (see search.py)
+    search_text = db.Column(db.Text, nullable=False, default='', server_default='')
+    # Bumped on every change to the row or its show counters; drives API ETags
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=utc_now(), index=True)
 
     def __repr__(self):
         return f'<Artist {self.id} {self.name}>'
 
+db.Index('ix_Artist_lower_name_id', db.func.lower(Artist.name), Artist.id)
+db.Index('ix_Artist_state_lower_name_id', Artist.state, db.func.lower(Artist.name), Artist.id)
+
 class Show(db.Model):
     __tablename__ = "Show"
+    __table_args__ = (
+        # Detail pages fetch one owner's shows ordered by start time; /shows pages on (start_time, id)
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        # The counter rollover looks for upcoming shows that have started
+        db.Index('ix_Show_upcoming_start_time', 'upcoming', 'start_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete="CASCADE"), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    # Whether the show is currently counted in upcoming_shows_count (see counters.py)
+    upcoming = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
 
     def __repr__(self):
         return f'<Show {self.id} {self.start_time} artist_id={self.artist_id} venue_id={self.venue_id}>'
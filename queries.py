@@ -0,0 +1,161 @@
+from datetime import datetime
+from functools import wraps
+
+from sqlalchemy.orm import Query
+
+from models import *
+
+# ----------------------------------------------------------------------------#
+# Queries.
+#
+# Builders that return session-less Query objects (the *_rows functions) are
+# shared with the ASGI app, which runs their statements on its async driver.
+# ----------------------------------------------------------------------------#
+
+def _split_shows(rows, now, build):
+    # Rows arrive ordered by start_time, so one pass splits past from upcoming
+    past_shows, upcoming_shows = [], []
+    past_count = upcoming_count = 0
+    for row in rows:
+        if row.start_time <= now:
+            past_shows.append(build(row))
+            past_count += 1
+        else:
+            upcoming_shows.append(build(row))
+            upcoming_count += 1
+    return (past_shows, past_count), (upcoming_shows, upcoming_count)
+
+
+def venue_show_rows(venue_id):
+    """The rows behind venue_shows() as a session-less query, ordered by start time."""
+    return Query([
+        Show.start_time, Show.artist_id, Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'), Artist.updated_at.label('artist_updated_at')
+    ]).join(Artist, Artist.id == Show.artist_id) \
+      .filter(Show.venue_id == venue_id) \
+      .order_by(Show.start_time, Show.id)
+
+
+def split_venue_shows(rows, now=None):
+    return _split_shows(rows, now or datetime.now(), lambda row: {
+        "artist_id": row.artist_id,
+        "artist_name": row.artist_name,
+        "artist_image_link": row.artist_image_link,
+        "artist_updated_at": row.artist_updated_at,
+        "start_time": row.start_time
+    })
+
+
+def venue_shows(venue_id, now=None):
+    """Past and upcoming shows of a venue with the artist columns the tiles need, in one query."""
+    return split_venue_shows(venue_show_rows(venue_id).with_session(db.session()), now)
+
+
+def artist_show_rows(artist_id):
+    """The rows behind artist_shows() as a session-less query, ordered by start time."""
+    return Query([
+        Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'), Venue.updated_at.label('venue_updated_at')
+    ]).join(Venue, Venue.id == Show.venue_id) \
+      .filter(Show.artist_id == artist_id) \
+      .order_by(Show.start_time, Show.id)
+
+
+def split_artist_shows(rows, now=None):
+    return _split_shows(rows, now or datetime.now(), lambda row: {
+        "venue_id": row.venue_id,
+        "venue_name": row.venue_name,
+        "venue_image_link": row.venue_image_link,
+        "venue_updated_at": row.venue_updated_at,
+        "start_time": row.start_time
+    })
+
+
+def artist_shows(artist_id, now=None):
+    """Past and upcoming shows of an artist with the venue columns the tiles need, in one query."""
+    return split_artist_shows(artist_show_rows(artist_id).with_session(db.session()), now)
+
+
+def venue_area_rows(limit_per_area=None):
+    """Venues grouped by (state, city) as a session-less query, keeping at most limit_per_area per area.
+
+    Each row carries its area's size, so the index can link areas it cut short
+    to their filtered directory.
+    """
+    area = (Venue.state, Venue.city)
+    rows = Query([
+        Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count, Venue.updated_at,
+        db.func.row_number().over(partition_by=area, order_by=(Venue.name, Venue.id)).label('position'),
+        db.func.count().over(partition_by=area).label('area_size')
+    ]).subquery()
+    query = Query([rows])
+    if limit_per_area:
+        query = query.filter(rows.c.position <= limit_per_area)
+    return query.order_by(rows.c.state, rows.c.city, rows.c.position)
+
+
+def directory_rows(model, after=None, starts_at=None, state=None, city=None, genre=None, limit=50):
+    """One page of venues or artists in (lower(name), id) order as a session-less query.
+
+    One row past the page is included, so the caller knows whether another
+    page follows. `after` is the (name, id) of the last row of the previous
+    page; `starts_at` jumps to the first name at or after a letter, in either
+    case. Both seek on the lower(name) index, so the jump and the cursor agree
+    on the order.
+    """
+    sort_name = db.func.lower(model.name)
+    query = Query([model.id, model.name, model.city, model.state, model.upcoming_shows_count, model.updated_at])
+    if state:
+        query = query.filter(model.state == state)
+    if city:
+        query = query.filter(model.city == city)
+    if genre:
+        query = query.filter(model.genres.any(Genre.name == genre))
+    if after:
+        after_name = db.func.lower(after[0])
+        # The plain range gives SQLite a seek on the expression index; the tuple does the rest
+        query = query.filter(sort_name >= after_name, db.tuple_(sort_name, model.id) > db.tuple_(after_name, after[1]))
+    elif starts_at:
+        query = query.filter(sort_name >= starts_at.lower())
+    return query.order_by(sort_name, model.id).limit(limit + 1)
+
+
+def show_tile_rows(date_from=None, date_to=None, after=None, limit=30):
+    """One page of shows in (start_time, id) order with the columns a show tile renders, as a session-less query.
+
+    Like directory_rows(), one row past the page is included. `after` is the
+    (start_time, id) of the last row of the previous page.
+    """
+    query = Query([
+        Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+        Venue.updated_at.label('venue_updated_at'), Show.artist_id, Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'), Artist.updated_at.label('artist_updated_at')
+    ]).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+    if date_from:
+        query = query.filter(Show.start_time >= date_from)
+    if date_to:
+        query = query.filter(Show.start_time < date_to)
+    if after:
+        # A row comparison lets the (start_time, id) index seek straight to the cursor
+        query = query.filter(db.tuple_(Show.start_time, Show.id) > db.tuple_(*after))
+    return query.order_by(Show.start_time, Show.id).limit(limit + 1)
+
+
+def read_page(queries):
+    """Split a read-only view into the session-less queries it runs and the rendering of their rows.
+
+    queries(**view_args) returns a dict of Query objects, and the view is
+    called with a dict of their rows in its place, plus its view args. Both run
+    in the request context. Under WSGI the queries run on the request session;
+    asgi.py runs them on its async driver instead.
+    """
+    def decorator(render):
+        @wraps(render)
+        def view(**kwargs):
+            session = db.session()
+            return render({ name: query.with_session(session).all() for name, query in queries(**kwargs).items() },
+                          **kwargs)
+        view.page_queries = queries
+        view.render_page = render
+        return view
+    return decorator
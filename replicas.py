@@ -0,0 +1,140 @@
+import itertools
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_app_context, has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+# ----------------------------------------------------------------------------#
+# Read replicas.
+#
+# Views decorated with @replica_reads send their queries to one of the
+# configured replicas, picked round-robin among those that are healthy. A
+# replica that fails to connect is skipped for REPLICA_RETRY_INTERVAL seconds,
+# and with no healthy replica reads fall back to the primary. Flushes and
+# INSERT/UPDATE/DELETE statements always go to the primary. After a write, the
+# client gets a short-lived cookie that pins its reads to the primary for
+# REPLICA_STICKY_SECONDS so it sees its own changes despite replication lag.
+# ----------------------------------------------------------------------------#
+
+STICKY_COOKIE = 'read_primary'
+POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_recycle', 'pool_timeout', 'pool_pre_ping')
+
+
+def engine_options(url, options):
+    """create_engine keyword arguments for a bind's pool and statement timeout settings."""
+    backend = make_url(url).get_backend_name()
+    selected = { key: options[key] for key in POOL_OPTIONS if key in options }
+    if backend == 'sqlite':
+        # SQLite has no server-side statement timeout, and its file pool takes no size
+        return { key: value for key, value in selected.items() if key == 'pool_pre_ping' }
+    if options.get('statement_timeout') and backend == 'postgresql':
+        selected['connect_args'] = { 'options': f"-c statement_timeout={int(options['statement_timeout'])}" }
+    return selected
+
+
+class Replica:
+    def __init__(self, url, options, retry_interval):
+        self.url = url
+        self.engine = create_engine(url, **engine_options(url, dict({ 'pool_pre_ping': True }, **options)))
+        self.retry_interval = retry_interval
+        self.down_until = 0
+        event.listen(self.engine, 'handle_error', self._handle_error)
+
+    def _handle_error(self, context):
+        # Connection failures take the replica out of rotation; query errors do not
+        if context.is_disconnect or context.connection is None:
+            self.mark_down()
+
+    def mark_down(self):
+        self.down_until = time.monotonic() + self.retry_interval
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+
+class ReplicaSet:
+    def __init__(self):
+        self.replicas = []
+        self.sticky_seconds = 0
+        self._cycle = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        primary_url = app.config['SQLALCHEMY_DATABASE_URI']
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).update(
+            engine_options(primary_url, app.config.get('DATABASE_PRIMARY_OPTIONS', {})))
+
+        retry_interval = app.config.get('REPLICA_RETRY_INTERVAL', 30)
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+        self.replicas = []
+        for replica in app.config.get('DATABASE_REPLICAS', []):
+            options = { 'url': replica } if isinstance(replica, str) else dict(replica)
+            self.replicas.append(Replica(options.pop('url'), options, retry_interval))
+        self._cycle = itertools.cycle(self.replicas)
+        app.extensions['replicas'] = self
+        app.after_request(self._pin_after_write)
+
+    def choose_replica(self):
+        """The next healthy replica, or None to read from the primary."""
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                replica = next(self._cycle)
+                if replica.healthy:
+                    return replica
+        return None
+
+    def choose(self):
+        """The next healthy replica's engine, or None to read from the primary."""
+        replica = self.choose_replica()
+        return replica.engine if replica else None
+
+    def _pin_after_write(self, response):
+        if self.replicas and g.get('wrote_to_primary'):
+            response.set_cookie(STICKY_COOKIE, '1', max_age=self.sticky_seconds, httponly=True)
+        return response
+
+    def status(self):
+        return [{ "url": repr(replica.engine.url), "healthy": replica.healthy } for replica in self.replicas]
+
+
+replica_set = ReplicaSet()
+
+
+def read_from_replica():
+    """Route the rest of this request's reads to a replica, unless the client is pinned to the primary."""
+    if replica_set.replicas and STICKY_COOKIE not in request.cookies:
+        g.replica_engine = replica_set.choose()
+
+
+def replica_reads(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        read_from_replica()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and not isinstance(clause, UpdateBase):
+            engine = g.get('replica_engine') if has_app_context() else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(session, flush_context):
+    if has_request_context():
+        g.wrote_to_primary = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,138 @@
+import re
+
+from sqlalchemy.orm import Query
+
+from models import *
+
+# ----------------------------------------------------------------------------#
+# Search.
+#
+# Venue and Artist keep a `search_text` column ("city state genres") next to
+# their name, refreshed on every insert/update. PostgreSQL searches a weighted
+# tsvector expression index plus pg_trgm indexes for partial matches; SQLite
+# mirrors each row into an FTS5 table ranked with bm25. Other dialects fall
+# back to ILIKE.
+# ----------------------------------------------------------------------------#
+
+SEARCH_CONFIG = "'simple'::regconfig"
+FTS_TABLES = { Venue: 'venue_search', Artist: 'artist_search' }
+NAME_WEIGHT = 10.0
+DETAILS_WEIGHT = 1.0
+
+
+def search_text_for(city, state, genre_names):
+    return ' '.join([city or '', state or ''] + list(genre_names))
+
+
+def search_details(entity):
+    return search_text_for(entity.city, entity.state, [genre.name for genre in entity.genres])
+
+
+def _tokens(search_term):
+    return re.findall(r'\w+', search_term.lower())
+
+
+def _tsvector(model):
+    config = db.literal_column(SEARCH_CONFIG)
+    return db.func.setweight(db.func.to_tsvector(config, model.name), 'A').op('||')(
+        db.func.setweight(db.func.to_tsvector(config, model.search_text), 'B'))
+
+
+def _postgresql_search(query, model, search_term):
+    tsquery = db.func.to_tsquery(db.literal_column(SEARCH_CONFIG),
+                                 ' & '.join(f'{token}:*' for token in _tokens(search_term)))
+    pattern = f'%{search_term}%'
+    vector = _tsvector(model)
+    rank = db.func.ts_rank(vector, tsquery) + db.func.similarity(model.name, search_term)
+    return query.filter(db.or_(vector.op('@@')(tsquery), model.name.ilike(pattern),
+                               model.search_text.ilike(pattern))), rank.desc()
+
+
+def _sqlite_search(query, model, search_term):
+    fts_name = FTS_TABLES[model]
+    fts = db.table(fts_name, db.column('rowid'))
+    fts_ref = db.literal_column(fts_name)
+    match = ' '.join(f'"{token}"*' for token in _tokens(search_term))
+    # bm25() is lower for better matches
+    rank = db.func.bm25(fts_ref, NAME_WEIGHT, DETAILS_WEIGHT)
+    return query.join(fts, fts.c.rowid == model.id).filter(fts_ref.op('MATCH')(match)), rank
+
+
+def search_queries(model, search_term, page=1, per_page=20, dialect=None):
+    """Session-less (rows, total) queries for one page of search_catalog(), for the given dialect name."""
+    query = Query([model.id, model.name, model.upcoming_shows_count])
+    search_term = search_term.strip()
+
+    if not _tokens(search_term):
+        query, rank = query, model.name
+    elif dialect == 'postgresql':
+        query, rank = _postgresql_search(query, model, search_term)
+    elif dialect == 'sqlite':
+        query, rank = _sqlite_search(query, model, search_term)
+    else:
+        pattern = f'%{search_term}%'
+        query, rank = query.filter(db.or_(model.name.ilike(pattern), model.search_text.ilike(pattern))), model.name
+
+    total = Query([db.func.count()]).select_from(query.subquery())
+    rows = query.order_by(rank, model.id).limit(per_page).offset((max(page, 1) - 1) * per_page)
+    return rows, total
+
+
+def search_catalog(model, search_term, page=1, per_page=20):
+    """One page of venues or artists matching search_term, best matches first. Returns (rows, total)."""
+    session = db.session()
+    rows, total = search_queries(model, search_term, page=page, per_page=per_page,
+                                 dialect=session.get_bind().dialect.name)
+    return rows.with_session(session).all(), total.with_session(session).scalar()
+
+
+#  Index maintenance
+#  ----------------------------------------------------------------
+
+def _refresh_search_text(mapper, connection, target):
+    target.search_text = search_details(target)
+
+
+def _index_document(mapper, connection, target):
+    if connection.dialect.name != 'sqlite':
+        return
+    fts_name = FTS_TABLES[type(target)]
+    connection.execute(db.text(f'DELETE FROM {fts_name} WHERE rowid = :id'), id=target.id)
+    connection.execute(db.text(f'INSERT INTO {fts_name} (rowid, name, details) VALUES (:id, :name, :details)'),
+                       id=target.id, name=target.name, details=target.search_text)
+
+
+def _unindex_document(mapper, connection, target):
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.execute(db.text(f'DELETE FROM {FTS_TABLES[type(target)]} WHERE rowid = :id'), id=target.id)
+
+
+def _register_search_index(model, fts_name):
+    table = model.__tablename__
+    db.event.listen(model, 'before_insert', _refresh_search_text)
+    db.event.listen(model, 'before_update', _refresh_search_text)
+    db.event.listen(model, 'after_insert', _index_document)
+    db.event.listen(model, 'after_update', _index_document)
+    db.event.listen(model, 'after_delete', _unindex_document)
+
+    db.event.listen(model.__table__, 'after_create', db.DDL(
+        f'CREATE VIRTUAL TABLE {fts_name} USING fts5(name, details)'
+    ).execute_if(dialect='sqlite'))
+    db.event.listen(model.__table__, 'after_drop', db.DDL(
+        f'DROP TABLE IF EXISTS {fts_name}'
+    ).execute_if(dialect='sqlite'))
+
+    for statement in (
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        f'CREATE INDEX "ix_{table}_search_vector" ON "{table}" USING gin ('
+        f"(setweight(to_tsvector({SEARCH_CONFIG}, name), 'A') || "
+        f"setweight(to_tsvector({SEARCH_CONFIG}, search_text), 'B')))",
+        f'CREATE INDEX "ix_{table}_name_trgm" ON "{table}" USING gin (name gin_trgm_ops)',
+        f'CREATE INDEX "ix_{table}_search_text_trgm" ON "{table}" USING gin (search_text gin_trgm_ops)',
+    ):
+        db.event.listen(model.__table__, 'after_create', db.DDL(statement).execute_if(dialect='postgresql'))
+
+
+for searchable, fts_table in FTS_TABLES.items():
+    _register_search_index(searchable, fts_table)
@@ -0,0 +1,168 @@
+import random
+import time
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from forms import GENRE_CHOICES, STATE_CHOICES
+from genres import genre_ids
+from importer import ForeignKeyResolver, insert_rows, write_artists, write_venues
+from models import *
+
+# ----------------------------------------------------------------------------#
+# Synthetic data.
+#
+# Builds a reproducible catalog for scale testing: the same seed always gives
+# the same rows, with show times relative to a fixed reference time rather
+# than the clock. Venues and artists are written through the importer's batch
+# writers. Shows are drawn with a Zipf-like skew, so a few venues and artists
+# get most of them, and split between the three years before the reference
+# and the year after it. Counters are accumulated in memory and written once
+# at the end instead of being updated per batch.
+# ----------------------------------------------------------------------------#
+
+# Shows after this are seeded as upcoming; the counter rollover moves them on once it passes
+REFERENCE_TIME = datetime(2024, 1, 1)
+STATES = [state for state, _ in STATE_CHOICES]
+GENRES = [genre for genre, _ in GENRE_CHOICES]
+# Rough share of venues and artists per state; unlisted states weigh 1
+STATE_WEIGHTS = { 'CA': 12, 'NY': 9, 'TX': 8, 'FL': 6, 'IL': 5, 'PA': 4, 'OH': 3, 'GA': 3, 'WA': 3, 'TN': 3 }
+CITIES = {
+    'CA': ['Los Angeles', 'San Francisco', 'San Diego', 'Oakland', 'Sacramento'],
+    'NY': ['New York', 'Brooklyn', 'Buffalo', 'Rochester'],
+    'TX': ['Austin', 'Houston', 'Dallas', 'San Antonio'],
+    'FL': ['Miami', 'Orlando', 'Tampa'],
+    'IL': ['Chicago', 'Evanston'],
+    'PA': ['Philadelphia', 'Pittsburgh'],
+    'TN': ['Nashville', 'Memphis'],
+    'WA': ['Seattle', 'Spokane'],
+    'GA': ['Atlanta', 'Athens'],
+}
+TOWNS = ['Springfield', 'Franklin', 'Greenville', 'Madison', 'Clinton', 'Salem', 'Fairview', 'Georgetown']
+ADJECTIVES = ['Blue', 'Golden', 'Electric', 'Velvet', 'Crimson', 'Silver', 'Midnight', 'Wild', 'Lucky', 'Hollow',
+              'Neon', 'Rusty', 'Painted', 'Broken', 'Little', 'Grand', 'Secret', 'Northern', 'Iron', 'Paper']
+NOUNS = ['Owl', 'Lantern', 'Anchor', 'Fox', 'Moon', 'River', 'Crow', 'Garden', 'Bell', 'Tiger', 'Harbor',
+         'Echo', 'Mirror', 'Canyon', 'Rose', 'Engine', 'Parlor', 'Wolf', 'Comet', 'Forest']
+VENUE_KINDS = ['Hall', 'Lounge', 'Club', 'Theatre', 'Room', 'Tavern', 'Ballroom', 'Saloon', 'Stage', 'Bar']
+FIRST_NAMES = ['Ada', 'Miles', 'Nina', 'Otis', 'Etta', 'Ray', 'Billie', 'Louis', 'Ella', 'Chet', 'Aretha', 'Sam',
+               'Joni', 'Hank', 'Patsy', 'Duke', 'Odetta', 'Woody', 'Carole', 'Marvin']
+LAST_NAMES = ['Rivers', 'Stone', 'Hayes', 'Brooks', 'Wells', 'Carter', 'Price', 'Monroe', 'Holiday', 'Fields',
+              'Young', 'Knight', 'Cole', 'Reed', 'Baker', 'Gray', 'Lane', 'Hart', 'Page', 'Shaw']
+STREETS = ['Main St', 'Market St', 'Broadway', 'Oak Ave', 'Mission St', 'Elm St', '2nd Ave', 'Sunset Blvd']
+
+
+def _cumulative_skew(count, exponent, rng):
+    # Zipf-like weights 1/rank^s, assigned to owners in random order
+    weights = [1 / (rank ** exponent) for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return list(accumulate(weights))
+
+
+def _pick(cumulative, rng):
+    return bisect(cumulative, rng.random() * cumulative[-1])
+
+
+def _owner_row(rng, state_weights):
+    state = rng.choices(STATES, cum_weights=state_weights)[0]
+    seeking = rng.random() < 0.2
+    return {
+        "city": rng.choice(CITIES.get(state, TOWNS)),
+        "state": state,
+        "phone": f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}',
+        "facebook_link": None,
+        "website": None,
+        "seeking_description": 'Looking for new acts to book this season.' if seeking else None,
+        "genres": rng.sample(GENRES, rng.randint(1, 3)),
+        "seeking": seeking,
+    }
+
+
+def venue_row(rng, state_weights):
+    row = _owner_row(rng, state_weights)
+    name = f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.choice(VENUE_KINDS)}'
+    row.update(name=name, address=f'{rng.randint(1, 9999)} {rng.choice(STREETS)}',
+               seeking_talent=row.pop("seeking"), image_link=Venue.image_link.default.arg)
+    return row
+
+
+def artist_row(rng, state_weights):
+    row = _owner_row(rng, state_weights)
+    if rng.random() < 0.5:
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+    else:
+        name = f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}s'
+    row.update(name=name, seeking_venue=row.pop("seeking"), image_link=Artist.image_link.default.arg)
+    return row
+
+
+def _write_owners(connection, write, make_row, count, batch_size, rng, state_weights, use_copy, resolver):
+    ids = []
+    for start in range(0, count, batch_size):
+        rows = [make_row(rng, state_weights) for _ in range(min(batch_size, count - start))]
+        write(connection, rows, resolver, use_copy)
+        ids.extend(row["id"] for row in rows)
+    return ids
+
+
+def seed_catalog(venues=1000, artists=2000, shows=50000, seed=0, upcoming_share=0.3, skew=1.0,
+                 batch_size=10000, use_copy=True, reference=None, report=print):
+    """Generate and insert a reproducible dataset. Returns the seconds taken.
+
+    Show times are placed around `reference` (default REFERENCE_TIME).
+    """
+    rng = random.Random(seed)
+    state_weights = list(accumulate(STATE_WEIGHTS.get(state, 1) for state in STATES))
+    # Shows start on the half hour, before the reference hour or after the next one
+    hour = (reference or REFERENCE_TIME).replace(minute=0, second=0, microsecond=0)
+    started = time.perf_counter()
+
+    connection = db.engine.connect()
+    try:
+        if connection.dialect.name == 'sqlite':
+            # The dataset is disposable; skip fsync between batches
+            connection.execute('PRAGMA synchronous = OFF')
+        resolver = ForeignKeyResolver(connection)
+        with connection.begin():
+            genre_ids(GENRES, connection=connection, pending=resolver.genres)
+            venue_ids = _write_owners(connection, write_venues, venue_row, venues, batch_size,
+                                      rng, state_weights, use_copy, resolver)
+            report(f'{venues} venues written ({time.perf_counter() - started:.1f}s)')
+            artist_ids = _write_owners(connection, write_artists, artist_row, artists, batch_size,
+                                       rng, state_weights, use_copy, resolver)
+            report(f'{artists} artists written ({time.perf_counter() - started:.1f}s)')
+        resolver.committed()
+
+        venue_skew = _cumulative_skew(venues, skew, rng)
+        artist_skew = _cumulative_skew(artists, skew, rng)
+        venue_counts = [[0, 0] for _ in range(venues)]
+        artist_counts = [[0, 0] for _ in range(artists)]
+        past_span, future_span = 3 * 365 * 24 * 60, 365 * 24 * 60
+        for start in range(0, shows, batch_size):
+            rows = []
+            for _ in range(min(batch_size, shows - start)):
+                venue, artist = _pick(venue_skew, rng), _pick(artist_skew, rng)
+                upcoming = rng.random() < upcoming_share
+                minutes = rng.randrange(future_span if upcoming else past_span) // 30 * 30
+                if upcoming:
+                    start_time = hour + timedelta(hours=1, minutes=minutes)
+                else:
+                    start_time = hour - timedelta(minutes=minutes + 30)
+                venue_counts[venue][upcoming] += 1
+                artist_counts[artist][upcoming] += 1
+                rows.append({ "venue_id": venue_ids[venue], "artist_id": artist_ids[artist],
+                              "start_time": start_time, "upcoming": upcoming })
+            with connection.begin():
+                insert_rows(connection, Show.__table__, rows, use_copy)
+            report(f'{start + len(rows)} shows written ({time.perf_counter() - started:.1f}s)')
+
+        with connection.begin():
+            for model, ids, counts in (Venue, venue_ids, venue_counts), (Artist, artist_ids, artist_counts):
+                connection.execute(
+                    model.__table__.update().where(model.id == db.bindparam('owner_id')).values(
+                        past_shows_count=db.bindparam('past'), upcoming_shows_count=db.bindparam('upcoming')),
+                    [{ "owner_id": owner_id, "past": past, "upcoming": upcoming }
+                     for owner_id, (past, upcoming) in zip(ids, counts) if past or upcoming]
+                )
+    finally:
+        connection.close()
+    return time.perf_counter() - started
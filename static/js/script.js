@@ -2,3 +2,32 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Suggest names from /api/typeahead as the user types into [data-typeahead] inputs
+document.querySelectorAll('input[data-typeahead]').forEach(function (input, n) {
+  var list = document.createElement('datalist');
+  var useId = input.dataset.typeaheadValue === 'id';
+  var pending = null;
+  list.id = 'typeahead-' + n;
+  input.setAttribute('list', list.id);
+  input.parentNode.appendChild(list);
+
+  input.addEventListener('input', function () {
+    var q = input.value.trim();
+    if (!q || (useId && /^\d+$/.test(q))) return;
+    clearTimeout(pending);
+    pending = setTimeout(function () {
+      fetch('/api/typeahead?kind=' + input.dataset.typeahead + '&q=' + encodeURIComponent(q))
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          list.innerHTML = '';
+          data.results.forEach(function (result) {
+            var option = document.createElement('option');
+            option.value = useId ? result.id : result.name;
+            option.label = result.name;
+            list.appendChild(option);
+          });
+        });
+    }, 100);
+  });
+});
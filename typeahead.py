@@ -0,0 +1,193 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app
+
+from models import *
+
+# ----------------------------------------------------------------------------#
+# Typeahead.
+#
+# An in-process prefix index over venue and artist names. Every word start of
+# a name is kept as a key in a sorted list, so a lookup is a binary search
+# followed by a scan of at most `limit` distinct matches. Committed inserts,
+# updates and deletes are applied incrementally; other workers' writes are
+# picked up by a periodic full rebuild, which runs on a background thread
+# while lookups keep using the previous index.
+# ----------------------------------------------------------------------------#
+
+class PrefixIndex:
+    def __init__(self):
+        self._keys = []
+        self._names = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _suffixes(name):
+        normalized = name.lower()
+        return [normalized[match.start():] for match in re.finditer(r'\w+', normalized)]
+
+    def _add(self, entity_id, name):
+        self._names[entity_id] = name
+        for key in self._suffixes(name):
+            insort(self._keys, (key, entity_id))
+
+    def _remove(self, entity_id):
+        name = self._names.pop(entity_id, None)
+        if name is None:
+            return
+        for key in self._suffixes(name):
+            position = bisect_left(self._keys, (key, entity_id))
+            if position < len(self._keys) and self._keys[position] == (key, entity_id):
+                del self._keys[position]
+
+    def load(self, rows):
+        keys, names = [], {}
+        for entity_id, name in rows:
+            names[entity_id] = name
+            keys.extend((key, entity_id) for key in self._suffixes(name))
+        keys.sort()
+        with self._lock:
+            self._keys, self._names = keys, names
+
+    def put(self, entity_id, name):
+        with self._lock:
+            self._remove(entity_id)
+            self._add(entity_id, name)
+
+    def discard(self, entity_id):
+        with self._lock:
+            self._remove(entity_id)
+
+    def lookup(self, prefix, limit=10):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+
+        results, seen = [], set()
+        with self._lock:
+            position = bisect_left(self._keys, (prefix,))
+            while position < len(self._keys) and len(results) < limit:
+                key, entity_id = self._keys[position]
+                if not key.startswith(prefix):
+                    break
+                if entity_id not in seen:
+                    seen.add(entity_id)
+                    results.append({"id": entity_id, "name": self._names[entity_id]})
+                position += 1
+        return results
+
+
+TYPEAHEAD_MODELS = { 'artist': Artist, 'venue': Venue }
+indexes = { kind: PrefixIndex() for kind in TYPEAHEAD_MODELS }
+_loaded_at = { 'time': None }
+_load_lock = threading.Lock()
+# Changes committed while a build reads the tables, to apply again once it is
+# swapped in; None when no build is running
+_build = { 'changes': None }
+_build_lock = threading.Lock()
+
+
+def build_typeahead_indexes():
+    with _build_lock:
+        _build['changes'] = []
+    try:
+        for kind, model in TYPEAHEAD_MODELS.items():
+            indexes[kind].load(db.session.query(model.id, model.name).yield_per(10000))
+    finally:
+        with _build_lock:
+            changes, _build['changes'] = _build['changes'], None
+    _loaded_at['time'] = time.monotonic()
+    _apply_changes(changes)
+
+
+def refresh_typeahead_indexes():
+    """Rebuild the indexes on a background thread, unless a build is already running."""
+    if not _load_lock.acquire(blocking=False):
+        return
+    app = current_app._get_current_object()
+
+    def rebuild():
+        try:
+            with app.app_context():
+                try:
+                    build_typeahead_indexes()
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            app.logger.error(f'Could not rebuild typeahead indexes: {e}')
+            # Keep serving the current indexes and try again after another interval
+            _loaded_at['time'] = time.monotonic()
+        finally:
+            _load_lock.release()
+
+    try:
+        threading.Thread(target=rebuild, name='typeahead-rebuild', daemon=True).start()
+    except BaseException:
+        _load_lock.release()
+        raise
+
+
+def typeahead_indexes_loaded():
+    return _loaded_at['time'] is not None
+
+
+def typeahead(kind, prefix, limit=10, refresh_interval=None):
+    """Top `limit` names of the given kind starting with (a word starting with) prefix."""
+    loaded_at = _loaded_at['time']
+    if loaded_at is None:
+        # Nothing to serve yet, so the first lookup waits for the build
+        with _load_lock:
+            if _loaded_at['time'] is None:
+                build_typeahead_indexes()
+    elif refresh_interval and time.monotonic() - loaded_at > refresh_interval:
+        refresh_typeahead_indexes()
+    return indexes[kind].lookup(prefix, limit)
+
+
+#  Incremental updates
+#  ----------------------------------------------------------------
+
+def _queue_change(session, kind, entity_id, name):
+    session.info.setdefault('typeahead_changes', []).append((kind, entity_id, name))
+
+
+def _register_typeahead_events(kind, model):
+    @db.event.listens_for(model, 'after_insert')
+    @db.event.listens_for(model, 'after_update')
+    def _queue_put(mapper, connection, target):
+        _queue_change(db.object_session(target), kind, target.id, target.name)
+
+    @db.event.listens_for(model, 'after_delete')
+    def _queue_discard(mapper, connection, target):
+        _queue_change(db.object_session(target), kind, target.id, None)
+
+
+for typeahead_kind, typeahead_model in TYPEAHEAD_MODELS.items():
+    _register_typeahead_events(typeahead_kind, typeahead_model)
+
+
+def _apply_changes(changes):
+    for kind, entity_id, name in changes:
+        if name is None:
+            indexes[kind].discard(entity_id)
+        else:
+            indexes[kind].put(entity_id, name)
+
+
+@db.event.listens_for(db.Session, 'after_commit')
+def _apply_typeahead_changes(session):
+    changes = session.info.pop('typeahead_changes', [])
+    with _build_lock:
+        if _build['changes'] is not None:
+            # A build may have read the rows before this commit
+            _build['changes'].extend(changes)
+    if _loaded_at['time'] is not None:
+        _apply_changes(changes)
+
+
+@db.event.listens_for(db.Session, 'after_rollback')
+def _drop_typeahead_changes(session):
+    session.info.pop('typeahead_changes', None)
@@ -0,0 +1,81 @@
+import os
+from datetime import datetime
+
+from sqlalchemy import event, exc
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.pool import Pool
+
+from formatting import DATETIME_FORMATS, format_datetime
+from genres import load_genre_cache
+from models import *
+from replicas import replica_set
+from typeahead import build_typeahead_indexes
+
+# ----------------------------------------------------------------------------#
+# Worker processes.
+#
+#   gunicorn --preload --workers 4 wsgi:app
+#
+# warm_up() does the work every worker would otherwise repeat on its first
+# requests: compiling the templates, formatting patterns and locale data,
+# configuring the mappers, and loading the genre cache and typeahead indexes.
+# Run once in a preloading master, the result is shared copy-on-write by
+# every forked worker. It ends by disposing the engines, so no pooled
+# connection is open at the fork. Any connection that is inherited anyway is
+# dropped by a pid check on checkout and replaced with a new one, never
+# shared with the parent.
+# ----------------------------------------------------------------------------#
+
+# DBAPI connections inherited from the parent, kept referenced so that the
+# child never closes them: closing one would end the parent's session on the
+# socket they share
+_inherited = []
+
+
+def _remember_pid(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+
+def _check_pid(dbapi_connection, connection_record, connection_proxy):
+    pid = os.getpid()
+    if connection_record.info.get('pid', pid) != pid:
+        _inherited.append(dbapi_connection)
+        connection_record.connection = connection_proxy.connection = None
+        # The pool discards the record and retries with a new connection
+        raise exc.DisconnectionError(
+            f"Connection record belongs to pid {connection_record.info['pid']}, checked out in pid {pid}")
+
+
+def install_fork_guards():
+    """Listen for connection checkouts on every pool; safe to call more than once."""
+    if not event.contains(Pool, 'checkout', _check_pid):
+        event.listen(Pool, 'connect', _remember_pid)
+        event.listen(Pool, 'checkout', _check_pid)
+
+
+def dispose_engines(app):
+    """Close every pooled connection of the primary and the replicas."""
+    with app.app_context():
+        db.engine.dispose()
+    for replica in replica_set.replicas:
+        replica.engine.dispose()
+
+
+def warm_up(app):
+    """Prepare `app` to serve its first requests without compiling or loading anything."""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    for format in DATETIME_FORMATS:
+        format_datetime(datetime.now(), format)
+    configure_mappers()
+
+    with app.test_request_context():
+        try:
+            load_genre_cache()
+            build_typeahead_indexes()
+        except Exception as e:
+            app.logger.error(f'Could not prime the caches: {e}')
+        finally:
+            db.session.remove()
+    dispose_engines(app)
+    return app
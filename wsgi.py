@@ -0,0 +1,13 @@
+from app import create_app
+from workers import warm_up
+
+# ----------------------------------------------------------------------------#
+# WSGI entry point.
+#
+#   gunicorn --preload --workers 4 --bind 0.0.0.0:3000 wsgi:app
+#
+# With --preload the app is built and warmed up once in the master process
+# before the workers are forked; without it, each worker warms itself up.
+# ----------------------------------------------------------------------------#
+
+app = warm_up(create_app())